@@ -1,15 +1,22 @@
 package com.kimi.kfc.kfc
 
 import android.os.Bundle
+import android.os.Handler
+import android.os.Looper
 import io.flutter.embedding.android.FlutterActivity
 import io.flutter.embedding.engine.FlutterEngine
 import io.flutter.plugin.common.MethodChannel
 import com.chaquo.python.Python
 import com.chaquo.python.android.AndroidPlatform
+import java.util.concurrent.ExecutorService
+import java.util.concurrent.Executors
 
 class MainActivity : FlutterActivity() {
     private val CHANNEL = "kfc.python.bridge"
     private var pythonBridge: Any? = null
+    // Bridge calls which block waiting for Python run here, off the platform thread
+    private val bridgeExecutor: ExecutorService = Executors.newCachedThreadPool()
+    private val mainHandler = Handler(Looper.getMainLooper())
 
     override fun configureFlutterEngine(flutterEngine: FlutterEngine) {
         super.configureFlutterEngine(flutterEngine)
@@ -50,6 +57,65 @@ class MainActivity : FlutterActivity() {
                         result.error("INVALID_ARGUMENT", "Message is null", null)
                     }
                 }
+                "switchSession" -> {
+                    val sessionId = call.argument<String>("sessionId")
+                    if (sessionId != null) {
+                        try {
+                            val response = switchSessionInPython(sessionId)
+                            result.success(response)
+                        } catch (e: Exception) {
+                            result.error("SESSION_ERROR", "Failed to switch session: ${e.message}", null)
+                        }
+                    } else {
+                        result.error("INVALID_ARGUMENT", "Session id is null", null)
+                    }
+                }
+                "startRun" -> {
+                    val message = call.argument<String>("message")
+                    if (message != null) {
+                        try {
+                            val runId = startRunInPython(message)
+                            result.success(runId)
+                        } catch (e: Exception) {
+                            result.error("RUN_ERROR", "Failed to start run: ${e.message}", null)
+                        }
+                    } else {
+                        result.error("INVALID_ARGUMENT", "Message is null", null)
+                    }
+                }
+                "pollEvents" -> {
+                    val runId = call.argument<String>("runId")
+                    val maxWaitMs = call.argument<Int>("maxWaitMs") ?: 1000
+                    val maxEvents = call.argument<Int>("maxEvents") ?: 0
+                    if (runId != null) {
+                        // Polling waits up to maxWaitMs for events, keep the UI responsive
+                        bridgeExecutor.execute {
+                            try {
+                                val frame = pollEventsFromPython(runId, maxWaitMs, maxEvents)
+                                mainHandler.post { result.success(frame) }
+                            } catch (e: Exception) {
+                                mainHandler.post {
+                                    result.error("POLL_ERROR", "Failed to poll events: ${e.message}", null)
+                                }
+                            }
+                        }
+                    } else {
+                        result.error("INVALID_ARGUMENT", "Run id is null", null)
+                    }
+                }
+                "cancelRun" -> {
+                    val runId = call.argument<String>("runId")
+                    if (runId != null) {
+                        try {
+                            val response = cancelRunInPython(runId)
+                            result.success(response)
+                        } catch (e: Exception) {
+                            result.error("CANCEL_ERROR", "Failed to cancel run: ${e.message}", null)
+                        }
+                    } else {
+                        result.error("INVALID_ARGUMENT", "Run id is null", null)
+                    }
+                }
                 "executeTool" -> {
                     val toolType = call.argument<String>("toolType")
                     val params = call.argument<String>("params")
@@ -74,7 +140,8 @@ class MainActivity : FlutterActivity() {
                 }
                 "getContextHistory" -> {
                     try {
-                        val history = getContextHistoryFromPython()
+                        val cursor = call.argument<String>("cursor")
+                        val history = getContextHistoryFromPython(cursor)
                         result.success(history)
                     } catch (e: Exception) {
                         result.error("HISTORY_ERROR", "Failed to get context history: ${e.message}", null)
@@ -111,6 +178,11 @@ class MainActivity : FlutterActivity() {
         }
     }
 
+    override fun onDestroy() {
+        bridgeExecutor.shutdown()
+        super.onDestroy()
+    }
+
     private fun initializePython() {
         if (!Python.isStarted()) {
             Python.start(AndroidPlatform(context))
@@ -132,6 +204,50 @@ class MainActivity : FlutterActivity() {
         return result.toString()
     }
 
+    private fun switchSessionInPython(sessionId: String): String {
+        if (pythonBridge == null) {
+            initializePython()
+        }
+        
+        val py = Python.getInstance()
+        val module = py.getModule("kimi_bridge")
+        val result = module.callAttr("switch_session", sessionId)
+        return result.toString()
+    }
+
+    private fun startRunInPython(message: String): String {
+        if (pythonBridge == null) {
+            initializePython()
+        }
+        
+        val py = Python.getInstance()
+        val module = py.getModule("kimi_bridge")
+        val result = module.callAttr("start_run", message)
+        return result.toString()
+    }
+
+    private fun pollEventsFromPython(runId: String, maxWaitMs: Int, maxEvents: Int): String {
+        if (pythonBridge == null) {
+            initializePython()
+        }
+        
+        val py = Python.getInstance()
+        val module = py.getModule("kimi_bridge")
+        val result = module.callAttr("poll_events", runId, maxWaitMs, maxEvents)
+        return result.toString()
+    }
+
+    private fun cancelRunInPython(runId: String): String {
+        if (pythonBridge == null) {
+            initializePython()
+        }
+        
+        val py = Python.getInstance()
+        val module = py.getModule("kimi_bridge")
+        val result = module.callAttr("cancel_run", runId)
+        return result.toString()
+    }
+
     private fun executeToolInPython(toolType: String, paramsJson: String): String {
         if (pythonBridge == null) {
             initializePython()
@@ -165,14 +281,19 @@ class MainActivity : FlutterActivity() {
         return result.toString()
     }
 
-    private fun getContextHistoryFromPython(): String {
+    private fun getContextHistoryFromPython(cursor: String?): String {
         if (pythonBridge == null) {
             initializePython()
         }
         
         val py = Python.getInstance()
         val module = py.getModule("kimi_bridge")
-        val result = module.callAttr("get_context_history")
+        // With a cursor only the messages appended since it are returned
+        val result = if (cursor != null) {
+            module.callAttr("get_context_history_since", cursor)
+        } else {
+            module.callAttr("get_context_history")
+        }
         return result.toString()
     }
 
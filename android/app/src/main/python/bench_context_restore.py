@@ -0,0 +1,92 @@
+"""Benchmark `Context.restore` with and without a snapshot for growing histories"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from kosong.message import Message, TextPart, ToolCall
+
+from kimi_cli.config import ContextStorage
+from kimi_cli.soul.context import Context
+
+SIZES = (1_000, 10_000, 100_000)
+# Messages per step: user/assistant with a tool call, then the tool result
+_STEP_MESSAGES = 3
+# Records appended after the snapshot, like the last steps of a session
+_TAIL_STEPS = 20
+
+
+def _step_messages(i: int) -> list[Message]:
+    return [
+        Message(role="user", content=f"Please look at file_{i}.py and fix the bug on line {i}."),
+        Message(
+            role="assistant",
+            content=[TextPart(text=f"Reading file_{i}.py first.")],
+            tool_calls=[
+                ToolCall(
+                    id=f"call_{i}",
+                    function=ToolCall.FunctionBody(
+                        name="ReadFile", arguments=f'{{"path": "file_{i}.py"}}'
+                    ),
+                )
+            ],
+        ),
+        Message(role="tool", content="x = 1\n" * 20, tool_call_id=f"call_{i}"),
+    ]
+
+
+async def _append_steps(context: Context, start: int, n_steps: int) -> None:
+    for i in range(start, start + n_steps):
+        await context.checkpoint(add_user_message=False)
+        await context.append_message(_step_messages(i))
+        await context.update_token_count(i * 100)
+
+
+async def _build_history(path: Path, n_messages: int) -> None:
+    context = Context(path, storage=ContextStorage(snapshot_interval_bytes=0))
+    n_steps = max(n_messages // _STEP_MESSAGES - _TAIL_STEPS, 0)
+    await _append_steps(context, 0, n_steps)
+    await context.snapshot()
+    await _append_steps(context, n_steps, _TAIL_STEPS)
+    await context.close()
+
+
+async def _time_restore(path: Path, runs: int) -> tuple[float, int]:
+    best = float("inf")
+    n_messages = 0
+    for _ in range(runs):
+        # never write a snapshot here, so that each run restores the same files
+        context = Context(path, storage=ContextStorage(snapshot_interval_bytes=0))
+        start = time.perf_counter()
+        await context.restore()
+        best = min(best, time.perf_counter() - start)
+        n_messages = len(context.history)
+        await context.close()
+    return best * 1000, n_messages
+
+
+async def main(sizes: list[int], runs: int) -> None:
+    print(f"{'messages':>10} {'file MiB':>9} {'full ms':>10} {'snapshot ms':>12} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            path = Path(tmp_dir) / f"history_{size}.jsonl"
+            await _build_history(path, size)
+            snapshot_ms, n_messages = await _time_restore(path, runs)
+            snapshot_bytes = path.with_suffix(".snapshot.json").read_bytes()
+            path.with_suffix(".snapshot.json").unlink()
+            full_ms, _ = await _time_restore(path, runs)
+            path.with_suffix(".snapshot.json").write_bytes(snapshot_bytes)
+            print(
+                f"{n_messages:>10} {path.stat().st_size / (1 << 20):>9.1f} "
+                f"{full_ms:>10.1f} {snapshot_ms:>12.1f} {full_ms / snapshot_ms:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--runs", type=int, default=3, help="keep the fastest of N restores")
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.runs))
@@ -4,17 +4,280 @@ Direct use of all kimi-cli features without simplification
 """
 
 import asyncio
+import concurrent.futures
+import contextlib
 import json
 import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Any, List, Optional, AsyncGenerator, Callable
+from typing import Dict, Any, List, Optional, AsyncGenerator, Callable, Coroutine, TypeVar
 from datetime import datetime
 
+from kosong.chat_provider import ChatProviderError
+from kosong.message import Message, TextPart, ThinkPart, ToolCall, ToolCallPart
+from kosong.tooling import ToolResult
+from pydantic import BaseModel, ValidationError
+
 # Import complete kimi-cli (local source code)
 from kimi_cli.app import KimiCLI
 from kimi_cli.session import Session
+from kimi_cli.soul import LLMNotSet, LLMNotSupported, MaxStepsReached, RunCancelled, run_soul
 from kimi_cli.soul.kimisoul import KimiSoul
+from kimi_cli.soul.toolset import CustomToolset
+from kimi_cli.utils.logging import logger
+from kimi_cli.utils.aiohttp import close_client_session
 from kimi_cli.utils.message import message_extract_text
+from kimi_cli.wire import WireMessage, WireUISide
+from kimi_cli.wire.message import (
+    ApprovalRequest,
+    ApprovalResponse,
+    StatusUpdate,
+    serialize_event,
+    serialize_tool_result,
+)
+
+_T = TypeVar("_T")
+
+
+class BridgeRuntime:
+    """
+    桥接运行时
+    持有一个运行在独立线程上的长生命周期事件循环,
+    所有同步入口都通过 `run_coroutine_threadsafe` 提交到该循环,
+    这样 KimiCLI.create 建立的 aiohttp 会话、provider 客户端和 MCP 连接可以跨调用复用。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """启动事件循环线程 (已启动时直接返回当前循环)"""
+        with self._lock:
+            if self._loop is not None and self.is_running:
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=_run_loop, name="kimi-bridge-loop", daemon=True)
+            thread.start()
+            ready.wait()
+
+            self._loop = loop
+            self._thread = thread
+            return loop
+
+    def submit(self, coro: Coroutine[Any, Any, _T]) -> "asyncio.Future[_T]":
+        """提交协程到后台循环, 返回 concurrent.futures.Future"""
+        loop = self.start()
+        return asyncio.run_coroutine_threadsafe(coro, loop)  # type: ignore[return-value]
+
+    def run(self, coro: Coroutine[Any, Any, _T], timeout: Optional[float] = None) -> _T:
+        """在后台循环上运行协程并同步等待结果"""
+        if self._thread is not None and threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("BridgeRuntime.run must not be called from the loop thread")
+        return self.submit(coro).result(timeout)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """取消所有挂起任务, 关闭异步生成器并停止循环线程"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None or thread is None:
+            return
+
+        async def _cancel_pending():
+            current = asyncio.current_task()
+            tasks = [t for t in asyncio.all_tasks() if t is not current]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+
+        if thread.is_alive():
+            with contextlib.suppress(Exception):
+                asyncio.run_coroutine_threadsafe(_cancel_pending(), loop).result(timeout)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+
+    def restart(self) -> asyncio.AbstractEventLoop:
+        """重启事件循环 (绑定在旧循环上的对象将失效)"""
+        self.shutdown()
+        return self.start()
+
+
+DEFAULT_POOL_MAX_SESSIONS = 4
+"""会话池中最多保持预热的 KimiCLI 实例数"""
+DEFAULT_POOL_MAX_BYTES = 64 << 20
+"""会话池中预热实例的估算内存上限"""
+_INSTANCE_OVERHEAD_BYTES = 4 << 20
+"""每个 KimiCLI 实例 (LLM 客户端、工具、系统提示等) 的估算固定开销"""
+
+
+@dataclass
+class _PoolEntry:
+    session: Session
+    create_kwargs: Dict[str, Any]
+    kimi: Optional[KimiCLI] = None
+    size: int = 0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    n_runs: int = 0
+    """正在进行的运行数, 大于 0 时实例不会被淘汰"""
+    closing: Optional[asyncio.Task[None]] = None
+    """被淘汰实例的关闭任务, 重新创建实例前需等待其完成, 避免两个实例同时写同一个历史文件"""
+
+
+class SessionPool:
+    """
+    KimiCLI 实例池
+    按 session id 保持最近使用的 N 个实例预热, 按 LRU 淘汰并以估算内存占用控制总量;
+    被淘汰的会话关闭实例 (写出历史并释放文件句柄和 MCP 连接), 下次访问时再通过
+    `KimiCLI.create` 懒加载 (从历史文件恢复); 正在运行的会话不会被淘汰
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = DEFAULT_POOL_MAX_SESSIONS,
+        max_bytes: int = DEFAULT_POOL_MAX_BYTES,
+    ):
+        self._max_sessions = max(max_sessions, 1)
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[str, _PoolEntry] = OrderedDict()
+        """所有已知会话, 按最近使用排序 (末尾为最近使用)"""
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    @property
+    def session_ids(self) -> list[str]:
+        return list(self._entries)
+
+    @property
+    def n_warm(self) -> int:
+        return sum(1 for entry in self._entries.values() if entry.kimi is not None)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.size for entry in self._entries.values() if entry.kimi is not None)
+
+    async def add(self, session: Session, **create_kwargs: Any) -> KimiCLI:
+        """创建新会话的实例并放入池中"""
+        entry = _PoolEntry(session=session, create_kwargs=create_kwargs)
+        self._entries[session.id] = entry
+        try:
+            return await self.get(session.id)
+        except BaseException:
+            self._entries.pop(session.id, None)
+            raise
+
+    async def get(self, session_id: str) -> KimiCLI:
+        """
+        获取会话实例, 并标记为最近使用
+        Raises:
+            KeyError: 会话不在池中
+        """
+        entry = self._entries[session_id]
+        self._entries.move_to_end(session_id)
+        async with entry.lock:
+            if entry.kimi is None:
+                if entry.closing is not None:
+                    await entry.closing
+                    entry.closing = None
+                entry.kimi = await KimiCLI.create(session=entry.session, **entry.create_kwargs)
+            kimi = entry.kimi
+        await self.touch(session_id)
+        return kimi
+
+    @contextlib.contextmanager
+    def running(self, session_id: str):
+        """标记会话正在运行, 期间实例不会被淘汰"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            yield
+            return
+        entry.n_runs += 1
+        try:
+            yield
+        finally:
+            entry.n_runs -= 1
+
+    async def touch(self, session_id: str) -> None:
+        """重新计算会话的内存占用 (历史增长后调用), 并在超出限制时淘汰"""
+        entry = self._entries.get(session_id)
+        if entry is None or entry.kimi is None:
+            return
+        try:
+            history_bytes = entry.session.history_file.stat().st_size
+        except OSError:
+            history_bytes = 0
+        entry.size = _INSTANCE_OVERHEAD_BYTES + history_bytes
+        await self._evict()
+
+    async def _evict(self) -> None:
+        # 先同步选出并摘下要淘汰的实例, 再等待它们关闭, 期间条目可能被并发访问
+        n_warm, total_bytes = self.n_warm, self.total_bytes
+        # 最近使用的会话永不淘汰
+        most_recent = next(reversed(self._entries), None)
+        closing: List[asyncio.Task[None]] = []
+        for session_id, entry in self._entries.items():
+            if n_warm <= self._max_sessions and total_bytes <= self._max_bytes:
+                break
+            if (
+                session_id == most_recent
+                or entry.kimi is None
+                or entry.lock.locked()
+                or entry.n_runs > 0
+            ):
+                continue
+            n_warm -= 1
+            total_bytes -= entry.size
+            entry.closing = asyncio.create_task(self._close_instance(entry.kimi))
+            closing.append(entry.closing)
+            entry.kimi = None
+            entry.size = 0
+        if closing:
+            await asyncio.wait(closing)
+
+    @staticmethod
+    async def _close_instance(kimi: KimiCLI) -> None:
+        try:
+            await kimi.close()
+        except Exception as e:
+            logger.warning(
+                "Failed to close session {session_id}: {error}",
+                session_id=kimi.session.id,
+                error=e,
+            )
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def close(self) -> None:
+        """关闭所有预热实例 (写出缓冲的历史记录并释放文件句柄), 并等待淘汰中的实例关闭完成"""
+        for entry in self._entries.values():
+            if entry.kimi is not None:
+                await self._close_instance(entry.kimi)
+            if entry.closing is not None:
+                await entry.closing
 
 
 class KimiBridge:
@@ -31,6 +294,8 @@ class KimiBridge:
     def __init__(self):
         self._kimi: Optional[KimiCLI] = None
         self._session: Optional[Session] = None
+        self._pool = SessionPool()
+        self._session_gc_started = False
         self._work_dir: Path = Path("/data/data/com.kimi.kfc.kfc/files/workspace")
         self._approval_callback: Optional[Callable] = None
         self._current_tool: Optional[str] = None
@@ -42,11 +307,18 @@ class KimiBridge:
         base_url: str = "",
         model_name: str = "",
         session_id: str = "",
+        session_gc: bool = False,
     ) -> Dict[str, Any]:
         """
         Initialize complete Kimi CLI instance with sandbox workspace
         Each session has its own isolated workspace directory
+        A session_id already known to the pool switches to it without a full bootstrap
+        session_gc cleans up old session files by the retention policy, off by default since
+        the app may still reference sessions this process has not loaded
         """
+        if session_id and session_id in self._pool:
+            return await self.switch_session(session_id)
+
         try:
             # Use provided workspace or create default
             if work_dir:
@@ -75,14 +347,19 @@ class KimiBridge:
                 work_dir=self._work_dir,
             )
             
-            # 创建 KimiCLI 实例 - 完整保留所有参数
-            self._kimi = await KimiCLI.create(
-                session=self._session,
+            # 创建 KimiCLI 实例 - 完整保留所有参数, 并放入会话池
+            self._kimi = await self._pool.add(
+                self._session,
                 yolo=True,  # 自动批准工具调用，支持多轮
                 mcp_configs=[],  # MCP配置稍后从Android传入
                 model_name=model_name or "moonshot-v1-8k",
                 thinking=False,  # 默认不启用思考模式
             )
+
+            # 首次初始化时在后台按保留策略清理过期的会话文件, 池中的会话都受保护
+            if session_gc and not self._session_gc_started:
+                self._session_gc_started = True
+                self._kimi.start_session_gc(self._pool.session_ids)
             
             return {
                 "success": True,
@@ -99,6 +376,35 @@ class KimiBridge:
                 "message": f"Initialization failed: {e}",
             }
     
+    async def switch_session(self, session_id: str) -> Dict[str, Any]:
+        """
+        切换到会话池中的会话
+        预热的会话直接复用, 已被淘汰的会话懒加载
+        """
+        if session_id not in self._pool:
+            return {
+                "success": False,
+                "error": f"未知会话: {session_id}",
+            }
+
+        try:
+            self._kimi = await self._pool.get(session_id)
+            self._session = self._kimi.session
+            self._work_dir = self._session.work_dir
+            return {
+                "success": True,
+                "session_id": self._session.id,
+                "work_dir": str(self._work_dir),
+                "message": "Session switched successfully",
+                "model": self._kimi.soul.model_name,
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "message": f"Switch session failed: {e}",
+            }
+
     async def send_message(self, message: str) -> Dict[str, Any]:
         """
         发送消息 - 完整的 Agent Loop
@@ -107,43 +413,29 @@ class KimiBridge:
         2. Tool Calling
         3. Approval 请求
         4. Context 更新
+        内部消费流式事件, 只返回最终结果
         """
-        if not self._kimi:
-            return {
-                "type": "error",
-                "content": "Kimi CLI 未初始化",
-            }
-        
-        try:
-            # 调用完整的 agent loop
-            await self._kimi.soul.run(message)
-            
-            # 获取最新的 AI 响应
-            history = self._kimi.soul.context.history
-            if history and history[-1].role == "assistant":
-                response_content = message_extract_text(history[-1])
-                return {
+        final: Dict[str, Any] = {
+            "type": "assistant",
+            "content": "",
+            "timestamp": datetime.now().isoformat(),
+        }
+        async for event in self.send_message_stream(message):
+            if event["type"] == "error":
+                return event
+            if event["type"] == "done":
+                final = {
                     "type": "assistant",
-                    "content": response_content,
-                    "timestamp": datetime.now().isoformat(),
+                    "content": event["content"],
+                    "timestamp": event["timestamp"],
                 }
-            
-            return {
-                "type": "assistant",
-                "content": "",
-                "timestamp": datetime.now().isoformat(),
-            }
-            
-        except Exception as e:
-            return {
-                "type": "error",
-                "content": f"发送消息失败: {str(e)}",
-            }
-    
+        return final
+
     async def send_message_stream(self, message: str) -> AsyncGenerator[Dict[str, Any], None]:
         """
         流式发送消息
-        TODO: 实现流式输出,需要修改 KimiSoul 支持流式回调
+        通过 `run_soul` 连接 wire, 在 LLM 输出和工具调用发生时逐个产出桥接事件,
+        最后产出 `done` 事件 (包含最终的 assistant 回复)
         """
         if not self._kimi:
             yield {
@@ -151,18 +443,76 @@ class KimiBridge:
                 "content": "Kimi CLI 未初始化",
             }
             return
-        
+        # 运行期间可能切换到其他会话, 之后只使用本次运行的实例
+        kimi = self._kimi
+        with self._pool.running(kimi.session.id):
+            async for event in self._stream_run(kimi, message):
+                yield event
+
+    async def _stream_run(
+        self, kimi: KimiCLI, message: str
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        events: asyncio.Queue[Optional[Dict[str, Any]]] = asyncio.Queue()
+        cancel_event = asyncio.Event()
+
+        async def _ui_loop(wire: WireUISide):
+            while True:
+                msg = await wire.receive()
+                if isinstance(msg, ApprovalRequest):
+                    # 桥接以 yolo 模式运行, 正常不会收到审批请求; 兜底直接批准避免卡死
+                    msg.resolve(ApprovalResponse.APPROVE)
+                    continue
+                event = wire_message_to_event(msg)
+                if event is not None:
+                    events.put_nowait(event)
+
+        run_task = asyncio.create_task(
+            run_soul(kimi.soul, message, _ui_loop, cancel_event)
+        )
+        # run_soul 返回前会排空 wire, 因此哨兵一定排在所有事件之后
+        run_task.add_done_callback(lambda _: events.put_nowait(None))
+
         try:
-            # 暂时使用非流式,后续可以通过监听 soul 的内部事件实现流式
-            result = await self.send_message(message)
-            yield result
-            
+            while (event := await events.get()) is not None:
+                yield event
+        finally:
+            if not run_task.done():
+                # 消费方提前退出, 取消本次运行
+                cancel_event.set()
+            await asyncio.wait([run_task])
+
+        try:
+            run_task.result()
+        except LLMNotSet:
+            yield {"type": "error", "content": "LLM 未配置"}
+            return
+        except LLMNotSupported as e:
+            yield {"type": "error", "content": f"LLM 不支持: {e}"}
+            return
+        except ChatProviderError as e:
+            yield {"type": "error", "content": f"LLM 服务错误: {e}"}
+            return
+        except MaxStepsReached as e:
+            yield {"type": "error", "content": f"达到最大步数: {e.n_steps}"}
+            return
+        except RunCancelled:
+            yield {"type": "error", "content": "已取消"}
+            return
         except Exception as e:
-            yield {
-                "type": "error",
-                "content": f"流式发送失败: {str(e)}",
-            }
-    
+            yield {"type": "error", "content": f"流式发送失败: {str(e)}"}
+            return
+
+        await self._pool.touch(kimi.session.id)
+        history = kimi.soul.context.history
+        content = ""
+        if history and history[-1].role == "assistant":
+            content = message_extract_text(history[-1])
+        yield {
+            "type": "done",
+            "content": content,
+            "timestamp": datetime.now().isoformat(),
+        }
+
     def get_context_history(self) -> List[Dict[str, Any]]:
         """
         获取完整的 Context 历史
@@ -172,19 +522,97 @@ class KimiBridge:
         
         try:
             history = self._kimi.soul.context.history
-            return [
-                {
-                    "role": msg.role,
-                    "content": message_extract_text(msg),
-                    "tool_calls": getattr(msg, 'tool_calls', None),
-                    "timestamp": getattr(msg, 'timestamp', None),
-                }
-                for msg in history
-            ]
+            return [serialize_message(msg) for msg in history]
         except Exception as e:
             print(f"获取历史失败: {e}")
             return []
+
+    def get_context_history_since(self, cursor: str = "") -> Dict[str, Any]:
+        """
+        增量获取 Context 历史
+        cursor 格式为 `<session_id>:<generation>:<offset>`, 只返回 offset 之后追加的消息;
+        当会话切换、回滚或压缩使之前的消息失效时, 返回完整历史并设置 reset
+        """
+        if not self._kimi:
+            return {"cursor": "", "reset": True, "messages": []}
+
+        context = self._kimi.soul.context
+        session_id = self._kimi.session.id
+        generation = context.generation
+        history = list(context.history)
+
+        offset = 0
+        reset = True
+        parts = cursor.rsplit(":", 2) if cursor else []
+        if len(parts) == 3 and parts[0] == session_id and parts[1] == str(generation):
+            try:
+                offset = int(parts[2])
+            except ValueError:
+                offset = 0
+            if 0 <= offset <= len(history):
+                reset = False
+            else:
+                offset = 0
+
+        return {
+            "cursor": f"{session_id}:{generation}:{len(history)}",
+            "reset": reset,
+            "messages": [serialize_message(msg) for msg in history[offset:]],
+        }
     
+    async def execute_tool(self, tool_name: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        直接执行工具, 不经过 LLM
+        参数先按工具的 `Params` 模型校验, 再通过 `CustomToolset.handle` 调用,
+        因此工具内部可以正常获取 current_tool_call
+        """
+        if not self._kimi:
+            return {"type": "tool", "tool_type": tool_name, "success": False, "message": "未初始化"}
+
+        toolset = self._kimi.soul.agent.toolset
+        assert isinstance(toolset, CustomToolset)
+        tool = toolset.find(tool_name)
+        if tool is None:
+            return {
+                "type": "tool",
+                "tool_type": tool_name,
+                "success": False,
+                "message": f"未知工具: {tool_name}",
+            }
+
+        params_type = getattr(tool, "params", None)
+        if isinstance(params_type, type) and issubclass(params_type, BaseModel):
+            try:
+                params_type.model_validate(params)
+            except ValidationError as e:
+                return {
+                    "type": "tool",
+                    "tool_type": tool_name,
+                    "success": False,
+                    "message": f"参数无效: {e}",
+                }
+
+        tool_call = ToolCall(
+            id=f"bridge_{uuid.uuid4().hex}",
+            function=ToolCall.FunctionBody(
+                name=tool_name,
+                arguments=json.dumps(params, ensure_ascii=False),
+            ),
+        )
+        handled = toolset.handle(tool_call)
+        tool_result = handled if isinstance(handled, ToolResult) else await handled
+        serialized = serialize_tool_result(tool_result)
+        return {
+            "type": "tool",
+            "tool_type": tool_name,
+            "success": serialized["ok"],
+            **serialized["result"],
+        }
+
+    async def close(self) -> None:
+        """关闭所有会话的历史文件"""
+        await self._pool.close()
+
     async def compact_context(self) -> Dict[str, Any]:
         """
         压缩 Context - 完整的 Kimi CLI 功能
@@ -193,7 +621,8 @@ class KimiBridge:
             return {"success": False, "error": "未初始化"}
         
         try:
-            await self._kimi.soul.compact_context()
+            with self._pool.running(self._kimi.session.id):
+                await self._kimi.soul.compact_context()
             return {
                 "success": True,
                 "message": "Context 压缩成功",
@@ -257,8 +686,132 @@ class KimiBridge:
             }
 
 
+def serialize_message(msg: Message) -> Dict[str, Any]:
+    """将 Context 中的消息转换为 JSON 可序列化的字典"""
+    tool_calls = getattr(msg, "tool_calls", None)
+    return {
+        "role": msg.role,
+        "content": message_extract_text(msg),
+        "tool_calls": [tc.model_dump(mode="json", exclude_none=True) for tc in tool_calls]
+        if tool_calls
+        else None,
+        "timestamp": getattr(msg, "timestamp", None),
+    }
+
+
+def wire_message_to_event(msg: WireMessage) -> Optional[Dict[str, Any]]:
+    """
+    将 wire 消息转换为桥接事件
+    文本/思考增量、工具调用、工具结果和状态更新使用扁平结构, 其余事件沿用 `serialize_event`
+    """
+    match msg:
+        case ApprovalRequest():
+            return None
+        case TextPart(text=text):
+            return {"type": "text", "content": text}
+        case ThinkPart(think=think):
+            return {"type": "thinking", "content": think}
+        case ToolCall():
+            return {
+                "type": "tool_call",
+                "id": msg.id,
+                "name": msg.function.name,
+                "arguments": msg.function.arguments or "",
+            }
+        case ToolCallPart():
+            return {"type": "tool_call_part", "arguments_part": msg.arguments_part or ""}
+        case ToolResult():
+            return {"type": "tool_result", **serialize_tool_result(msg)}
+        case StatusUpdate():
+            return {
+                "type": "status",
+                "context_usage": msg.status.context_usage,
+                "cache_hit_rate": msg.status.cache_hit_rate,
+            }
+        case _:
+            return serialize_event(msg)
+
+
+FRAME_INTERVAL_S = 1 / 30
+"""poll_events 的目标帧间隔 (~30 fps)"""
+
+_MERGEABLE_EVENT_FIELDS = {
+    "text": "content",
+    "thinking": "content",
+    "tool_call_part": "arguments_part",
+}
+"""可以合并的增量事件类型及其增量字段"""
+
+
+def _append_coalesced(events: List[Dict[str, Any]], event: Dict[str, Any]) -> None:
+    """追加事件, 与末尾同类型的增量事件合并"""
+    field = _MERGEABLE_EVENT_FIELDS.get(event["type"])
+    if field is not None and events and events[-1]["type"] == event["type"]:
+        events[-1] = {**events[-1], field: events[-1][field] + event[field]}
+    else:
+        events.append(event)
+
+
+class BridgeRun:
+    """
+    一次后台运行
+    事件由事件循环线程写入缓冲区, Kotlin 线程通过 `poll` 按帧批量拉取,
+    避免每个 token 都跨一次 JNI
+    """
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.future: Optional[concurrent.futures.Future[None]] = None
+        self._cond = threading.Condition()
+        self._pending: List[Dict[str, Any]] = []
+        self._finished = False
+        self._last_frame_at = 0.0
+
+    def push(self, event: Dict[str, Any]) -> None:
+        with self._cond:
+            _append_coalesced(self._pending, event)
+            self._cond.notify_all()
+
+    def finish(self) -> None:
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+
+    def poll(self, max_wait_ms: int, max_events: int) -> Dict[str, Any]:
+        """
+        拉取一帧事件
+        空闲时 (如等待工具执行) 最多阻塞 `max_wait_ms`;
+        有事件时会继续合并增量直到距上一帧满一个帧间隔, 因此流式输出时约 30 帧/秒,
+        而长时间空闲后的第一个事件会立即返回
+        """
+        deadline = time.monotonic() + max(max_wait_ms, 0) / 1000
+        with self._cond:
+            self._cond.wait_for(
+                lambda: bool(self._pending) or self._finished,
+                timeout=max(deadline - time.monotonic(), 0),
+            )
+            if self._pending and not self._finished:
+                frame_at = min(self._last_frame_at + FRAME_INTERVAL_S, deadline)
+                while not self._finished and (remaining := frame_at - time.monotonic()) > 0:
+                    self._cond.wait(remaining)
+
+            limit = max_events if max_events > 0 else len(self._pending)
+            events = self._pending[:limit]
+            del self._pending[:limit]
+            has_more = bool(self._pending)
+            self._last_frame_at = time.monotonic()
+            return {
+                "run_id": self.run_id,
+                "events": events,
+                "done": self._finished and not has_more,
+                "next_poll_ms": 0 if has_more else round(FRAME_INTERVAL_S * 1000),
+            }
+
+
 # 全局单例
 _bridge: Optional[KimiBridge] = None
+_runtime = BridgeRuntime()
+_runs: Dict[str, BridgeRun] = {}
 
 
 def get_bridge() -> KimiBridge:
@@ -269,35 +822,45 @@ def get_bridge() -> KimiBridge:
     return _bridge
 
 
+def get_runtime() -> BridgeRuntime:
+    """获取桥接运行时单例"""
+    return _runtime
+
+
 # === 导出给 Dart 调用的同步包装函数 ===
 
-def initialize(work_dir: str = "", api_key: str = "", base_url: str = "", model_name: str = "") -> str:
+def initialize(
+    work_dir: str = "",
+    api_key: str = "",
+    base_url: str = "",
+    model_name: str = "",
+    session_id: str = "",
+    session_gc: bool = False,
+) -> str:
     """初始化 Kimi CLI"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        result = loop.run_until_complete(
-            get_bridge().initialize(
-                work_dir=work_dir or "",
-                api_key=api_key or "",
-                base_url=base_url or "",
-                model_name=model_name or "",
-            )
+    result = _runtime.run(
+        get_bridge().initialize(
+            work_dir=work_dir or "",
+            api_key=api_key or "",
+            base_url=base_url or "",
+            model_name=model_name or "",
+            session_id=session_id or "",
+            session_gc=bool(session_gc),
         )
-        return json.dumps(result, ensure_ascii=False)
-    finally:
-        loop.close()
+    )
+    return json.dumps(result, ensure_ascii=False)
+
+
+def switch_session(session_id: str) -> str:
+    """切换会话"""
+    result = _runtime.run(get_bridge().switch_session(session_id))
+    return json.dumps(result, ensure_ascii=False)
 
 
 def send_message(message: str) -> str:
     """发送消息"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        result = loop.run_until_complete(get_bridge().send_message(message))
-        return json.dumps(result, ensure_ascii=False)
-    finally:
-        loop.close()
+    result = _runtime.run(get_bridge().send_message(message))
+    return json.dumps(result, ensure_ascii=False)
 
 
 def get_context_history() -> str:
@@ -306,15 +869,23 @@ def get_context_history() -> str:
     return json.dumps(history, ensure_ascii=False)
 
 
+def get_context_history_since(cursor: str = "") -> str:
+    """增量获取历史记录"""
+    history = get_bridge().get_context_history_since(cursor or "")
+    return json.dumps(history, ensure_ascii=False)
+
+
+def execute_tool(tool_name: str, params_json: str = "{}") -> str:
+    """直接执行工具"""
+    params = json.loads(params_json) if params_json else {}
+    result = _runtime.run(get_bridge().execute_tool(tool_name, params))
+    return json.dumps(result, ensure_ascii=False)
+
+
 def compact_context() -> str:
     """压缩 Context"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        result = loop.run_until_complete(get_bridge().compact_context())
-        return json.dumps(result, ensure_ascii=False)
-    finally:
-        loop.close()
+    result = _runtime.run(get_bridge().compact_context())
+    return json.dumps(result, ensure_ascii=False)
 
 
 def get_status() -> str:
@@ -325,13 +896,87 @@ def get_status() -> str:
 
 def add_mcp_server(name: str, url: str, protocol: str, headers_json: str = "{}") -> str:
     """添加 MCP 服务器"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        headers = json.loads(headers_json) if headers_json else {}
-        result = loop.run_until_complete(
-            get_bridge().add_mcp_server(name, url, protocol, headers)
+    headers = json.loads(headers_json) if headers_json else {}
+    result = _runtime.run(get_bridge().add_mcp_server(name, url, protocol, headers))
+    return json.dumps(result, ensure_ascii=False)
+
+
+def start_run(message: str) -> str:
+    """启动一次后台运行, 返回 run_id, 之后通过 poll_events 拉取事件"""
+    bridge = get_bridge()
+    run = BridgeRun(uuid.uuid4().hex)
+
+    async def _drive():
+        try:
+            async for event in bridge.send_message_stream(message):
+                run.push(event)
+        finally:
+            run.finish()
+
+    _runs[run.run_id] = run
+    run.future = _runtime.submit(_drive())
+    return run.run_id
+
+
+def poll_events(run_id: str, max_wait_ms: int = 1000, max_events: int = 0) -> str:
+    """
+    拉取一帧事件 (JSON), 相邻的文本/思考增量已合并
+    max_events <= 0 表示不限制; 返回的 next_poll_ms 为建议的下一次轮询延迟
+    """
+    run = _runs.get(run_id)
+    if run is None:
+        return json.dumps(
+            {"run_id": run_id, "events": [], "done": True, "error": "未知的 run_id"},
+            ensure_ascii=False,
         )
-        return json.dumps(result, ensure_ascii=False)
+    frame = run.poll(int(max_wait_ms), int(max_events))
+    if frame["done"]:
+        _runs.pop(run_id, None)
+    return json.dumps(frame, ensure_ascii=False)
+
+
+def cancel_run(run_id: str) -> str:
+    """取消一次后台运行"""
+    run = _runs.get(run_id)
+    if run is None or run.future is None:
+        return json.dumps({"success": False, "error": "未知的 run_id"}, ensure_ascii=False)
+    run.future.cancel()
+    return json.dumps({"success": True}, ensure_ascii=False)
+
+
+async def _release_resources() -> None:
+    """写出缓冲的会话历史, 并关闭共享的 HTTP 连接"""
+    try:
+        if _bridge is not None:
+            await _bridge.close()
     finally:
-        loop.close()
+        await close_client_session()
+
+
+def shutdown() -> str:
+    """关闭后台事件循环, 释放所有连接"""
+    global _bridge
+    if _runtime.is_running:
+        with contextlib.suppress(Exception):
+            _runtime.run(_release_resources(), timeout=5.0)
+    _runtime.shutdown()
+    for run in _runs.values():
+        run.finish()
+    _runs.clear()
+    # 旧实例绑定在已关闭的循环上, 需要重新初始化
+    _bridge = None
+    return json.dumps({"success": True}, ensure_ascii=False)
+
+
+def restart() -> str:
+    """重启后台事件循环, 之后需要重新调用 initialize"""
+    global _bridge
+    if _runtime.is_running:
+        with contextlib.suppress(Exception):
+            _runtime.run(_release_resources(), timeout=5.0)
+    _runtime.restart()
+    for run in _runs.values():
+        run.finish()
+    _runs.clear()
+    _bridge = None
+    return json.dumps({"success": True}, ensure_ascii=False)
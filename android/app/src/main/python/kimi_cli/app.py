@@ -1,26 +1,32 @@
 from __future__ import annotations
 
+import asyncio
 import contextlib
 import os
 import warnings
-from collections.abc import Generator
+from collections.abc import Generator, Iterable
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 from pydantic import SecretStr
 
 from kimi_cli.agentspec import DEFAULT_AGENT_FILE
-from kimi_cli.cli import InputFormat, OutputFormat
 from kimi_cli.config import LLMModel, LLMProvider, load_config
 from kimi_cli.llm import augment_provider_with_env_vars, create_llm
 from kimi_cli.session import Session
+from kimi_cli.session_gc import SessionGCResult, start_session_gc
 from kimi_cli.soul import LLMNotSet, LLMNotSupported
 from kimi_cli.soul.agent import load_agent
 from kimi_cli.soul.context import Context
 from kimi_cli.soul.kimisoul import KimiSoul
 from kimi_cli.soul.runtime import Runtime
+from kimi_cli.soul.toolset import CustomToolset
 from kimi_cli.utils.logging import StreamToLogger, logger
 
+if TYPE_CHECKING:
+    # `kimi_cli.cli` pulls in typer, keep it out of the import path of embedders like the bridge
+    from kimi_cli.cli import InputFormat, OutputFormat
+
 
 class KimiCLI:
     @staticmethod
@@ -87,7 +93,7 @@ class KimiCLI:
             agent_file = DEFAULT_AGENT_FILE
         agent = await load_agent(agent_file, runtime, mcp_configs=mcp_configs or [])
 
-        context = Context(session.history_file)
+        context = Context(session.history_file, storage=config.context_storage)
         await context.restore()
 
         soul = KimiSoul(
@@ -110,6 +116,7 @@ class KimiCLI:
         self._soul = _soul
         self._runtime = _runtime
         self._env_overrides = _env_overrides
+        self._session_gc_task: asyncio.Task[SessionGCResult | None] | None = None
 
     @property
     def soul(self) -> KimiSoul:
@@ -121,6 +128,26 @@ class KimiCLI:
         """Get the Session instance."""
         return self._runtime.session
 
+    async def close(self) -> None:
+        """Write out the buffered history and close the connections held by the tools."""
+        await self._soul.context.close()
+        if isinstance(toolset := self._soul.agent.toolset, CustomToolset):
+            await toolset.close()
+
+    def start_session_gc(
+        self, protected_session_ids: Iterable[str] = ()
+    ) -> asyncio.Task[SessionGCResult | None]:
+        """
+        Clean up old session files in the background, keeping the current session and the
+        given sessions.
+        """
+        if self._session_gc_task is None:
+            self._session_gc_task = start_session_gc(
+                self._runtime.config.session_retention,
+                [self._runtime.session.id, *protected_session_ids],
+            )
+        return self._session_gc_task
+
     @contextlib.contextmanager
     def _app_env(self) -> Generator[None]:
         original_cwd = Path.cwd()
@@ -136,6 +163,7 @@ class KimiCLI:
     async def run_shell_mode(self, command: str | None = None) -> bool:
         from kimi_cli.ui.shell import ShellApp, WelcomeInfoItem
 
+        self.start_session_gc()
         welcome_info = [
             WelcomeInfoItem(name="Directory", value=str(self._runtime.session.work_dir)),
             WelcomeInfoItem(name="Session", value=self._runtime.session.id),
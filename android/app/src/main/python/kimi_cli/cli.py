@@ -297,23 +297,26 @@ def kimi(
             thinking=thinking_mode,
             agent_file=agent_file,
         )
-        match ui:
-            case "shell":
-                succeeded = await instance.run_shell_mode(command)
-            case "print":
-                succeeded = await instance.run_print_mode(
-                    input_format or "text",
-                    output_format or "text",
-                    command,
-                )
-            case "acp":
-                if command is not None:
-                    logger.warning("ACP server ignores command argument")
-                succeeded = await instance.run_acp_server()
-            case "wire":
-                if command is not None:
-                    logger.warning("Wire server ignores command argument")
-                succeeded = await instance.run_wire_server()
+        try:
+            match ui:
+                case "shell":
+                    succeeded = await instance.run_shell_mode(command)
+                case "print":
+                    succeeded = await instance.run_print_mode(
+                        input_format or "text",
+                        output_format or "text",
+                        command,
+                    )
+                case "acp":
+                    if command is not None:
+                        logger.warning("ACP server ignores command argument")
+                    succeeded = await instance.run_acp_server()
+                case "wire":
+                    if command is not None:
+                        logger.warning("Wire server ignores command argument")
+                    succeeded = await instance.run_wire_server()
+        finally:
+            await instance.soul.context.close()
 
         if succeeded:
             metadata = load_metadata()
@@ -340,9 +343,17 @@ def kimi(
 
         return succeeded
 
+    async def _main() -> bool:
+        from kimi_cli.utils.aiohttp import close_client_session
+
+        try:
+            return await _run()
+        finally:
+            await close_client_session()
+
     while True:
         try:
-            succeeded = asyncio.run(_run())
+            succeeded = asyncio.run(_main())
             if succeeded:
                 break
             sys.exit(1)
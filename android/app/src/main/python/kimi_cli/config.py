@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import json
 from pathlib import Path
-from typing import Self
+from typing import Literal, Self
 
 from pydantic import BaseModel, Field, SecretStr, ValidationError
 try:
@@ -23,6 +23,19 @@ from kimi_cli.share import get_share_dir
 from kimi_cli.utils.logging import logger
 
 
+class RateLimit(BaseModel):
+    """Client-side rate limits of an LLM provider, shared by the agent and its subagents."""
+
+    requests_per_minute: int | None = Field(default=None, ge=1)
+    """Maximum number of requests per minute, or None for no limit"""
+    tokens_per_minute: int | None = Field(default=None, ge=1)
+    """Maximum number of tokens (input and output) per minute, or None for no limit"""
+    circuit_breaker_threshold: int | None = Field(default=5, ge=1)
+    """Consecutive connection errors, timeouts or 5xx responses which make requests fail fast"""
+    circuit_breaker_cooldown_s: float = Field(default=30.0, gt=0)
+    """How long requests fail fast before one is sent to probe the provider (unit: s)"""
+
+
 class LLMProvider(BaseModel):
     """LLM provider configuration."""
 
@@ -34,6 +47,8 @@ class LLMProvider(BaseModel):
     """API key"""
     custom_headers: dict[str, str] | None = None
     """Custom headers to include in API requests"""
+    rate_limit: RateLimit = Field(default_factory=RateLimit)
+    """Client-side rate limits"""
 
     @field_serializer("api_key", when_used="json")
     def dump_secret(self, v: SecretStr):
@@ -51,6 +66,8 @@ class LLMModel(BaseModel):
     """Maximum context size (unit: tokens)"""
     capabilities: set[ModelCapability] | None = None
     """Model capabilities"""
+    preserved_context_ratio: float = Field(default=0.1, ge=0, lt=1)
+    """Share of the context size kept verbatim by compaction, as the most recent messages"""
 
 
 class LoopControl(BaseModel):
@@ -60,6 +77,63 @@ class LoopControl(BaseModel):
     """Maximum number of steps in one run"""
     max_retries_per_step: int = 3
     """Maximum number of retries in one step"""
+    max_parallel_tool_calls: int = Field(default=8, ge=1)
+    """Maximum number of tool calls running at the same time"""
+    compaction: Literal["simple", "rolling", "pruning", "chunked"] = "simple"
+    """
+    How the context is compacted: summarized as a whole, one new segment at a time, by
+    pruning stale tool outputs first and summarizing as a whole only if that is not enough,
+    or summarized in chunks which are then merged, for histories larger than the model window
+    """
+    precompaction_threshold: float | None = Field(default=0.7, gt=0, lt=1)
+    """
+    Usage of the context window left by the tokens reserved for the response, at which
+    compaction starts in the background, or None to disable it
+    """
+    prompt_layout: Literal["inline", "stable_prefix"] = "inline"
+    """
+    Whether the session time and directory listing are inlined in the system prompt, or sent
+    in a trailing message so that the system prompt stays byte-stable for prompt caching
+    """
+
+
+class ContextStorage(BaseModel):
+    """Context history storage configuration."""
+
+    format: Literal["jsonl", "binary"] = "jsonl"
+    """History file format; existing files are converted when they are restored"""
+    flush_policy: Literal["step", "interval"] = "step"
+    """When buffered history records are written: at every checkpoint, or every interval"""
+    flush_interval_ms: int = Field(default=200, ge=1)
+    """Maximum time a record stays buffered under the `interval` policy (unit: ms)"""
+    fsync_on_checkpoint: bool = False
+    """Whether to fsync the history file at every checkpoint"""
+    snapshot_interval_bytes: int = Field(default=1 << 20, ge=0)
+    """
+    Write a restore snapshot after this many bytes are appended to the history, or a quarter
+    of the latest snapshot size if larger, 0 to disable
+    """
+
+
+class SessionRetention(BaseModel):
+    """Retention policy of session history files, `None` disables a limit."""
+
+    max_age_days: int | None = Field(default=30, ge=1)
+    """Delete sessions not modified for this many days"""
+    max_rotations_per_session: int | None = Field(default=20, ge=0)
+    """Maximum number of rotated and subagent history files kept per session"""
+    max_total_bytes: int | None = Field(default=512 << 20, ge=0)
+    """Budget of all session files, the oldest files are deleted first when exceeded"""
+
+
+class ToolCache(BaseModel):
+    """Cache of read-only tool results (ReadFile, Glob and Grep)."""
+
+    enabled: bool = True
+    max_bytes: int = Field(default=8 << 20, ge=0)
+    """Budget of all cached results, the least recently used are evicted first"""
+    max_entry_bytes: int = Field(default=1 << 20, ge=0)
+    """Results larger than this are not cached"""
 
 
 class MoonshotSearchConfig(BaseModel):
@@ -93,6 +167,13 @@ class Config(BaseModel):
         default_factory=dict, description="List of LLM providers"
     )
     loop_control: LoopControl = Field(default_factory=LoopControl, description="Agent loop control")
+    context_storage: ContextStorage = Field(
+        default_factory=ContextStorage, description="Context history storage"
+    )
+    session_retention: SessionRetention = Field(
+        default_factory=SessionRetention, description="Session history retention"
+    )
+    tool_cache: ToolCache = Field(default_factory=ToolCache, description="Tool result cache")
     services: Services = Field(default_factory=Services, description="Services configuration")
 
     @model_validator(mode="after")
@@ -8,8 +8,14 @@ from kosong.chat_provider import ChatProvider
 from pydantic import SecretStr
 
 from kimi_cli.constant import USER_AGENT
+from kimi_cli.rate_limit import RateGovernor, get_rate_governor
 
 if TYPE_CHECKING:
+    from kosong.chat_provider.kimi import Kimi
+    from kosong.contrib.chat_provider.anthropic import Anthropic
+    from kosong.contrib.chat_provider.openai_legacy import OpenAILegacy
+    from kosong.contrib.chat_provider.openai_responses import OpenAIResponses
+
     from kimi_cli.config import LLMModel, LLMProvider
 
 type ProviderType = Literal["kimi", "openai_legacy", "openai_responses", "anthropic", "_chaos"]
@@ -23,6 +29,8 @@ class LLM:
     chat_provider: ChatProvider
     max_context_size: int
     capabilities: set[ModelCapability]
+    preserved_context_ratio: float = 0.1
+    rate_governor: RateGovernor | None = None
 
     @property
     def model_name(self) -> str:
@@ -133,9 +141,27 @@ def create_llm(
         chat_provider=chat_provider,
         max_context_size=model.max_context_size,
         capabilities=_derive_capabilities(provider, model),
+        preserved_context_ratio=model.preserved_context_ratio,
+        rate_governor=get_rate_governor(provider),
     )
 
 
+def with_max_completion_tokens(chat_provider: ChatProvider, max_tokens: int) -> ChatProvider:
+    """
+    Return a copy of the chat provider which generates at most `max_tokens` tokens, or the
+    chat provider itself if it cannot be limited.
+    """
+    match chat_provider.name:
+        case "kimi" | "openai" | "anthropic":
+            provider = cast("Kimi | OpenAILegacy | Anthropic", chat_provider)
+            return provider.with_generation_kwargs(max_tokens=max_tokens)
+        case "openai-responses":
+            provider = cast("OpenAIResponses", chat_provider)
+            return provider.with_generation_kwargs(max_output_tokens=max_tokens)
+        case _:
+            return chat_provider
+
+
 def _derive_capabilities(provider: LLMProvider, model: LLMModel) -> set[ModelCapability]:
     capabilities = model.capabilities or set()
     if provider.type != "kimi":
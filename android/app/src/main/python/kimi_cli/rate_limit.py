@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import hashlib
+import re
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Mapping
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any
+
+from kosong.chat_provider import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    ChatProviderError,
+)
+
+from kimi_cli.utils.logging import logger
+
+if TYPE_CHECKING:
+    from kimi_cli.config import LLMProvider, RateLimit
+
+_MAX_RETRY_AFTER_S = 300.0
+"""Longer delays requested by a provider are capped to this."""
+_LOG_WAIT_S = 1.0
+"""Waits longer than this are logged."""
+_OUTAGE_STATUS_CODES = (500, 502, 503, 504)
+_RETRY_AFTER_STATUS_CODES = (429, 503)
+"""Responses whose headers tell when to retry."""
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class CircuitOpenError(ChatProviderError):
+    """The error raised instead of sending a request while the provider is failing."""
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: int):
+        self._capacity = float(per_minute)
+        self._rate = per_minute / 60
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken, which is capped to the capacity."""
+        self._refill(now)
+        return max(0.0, (min(amount, self._capacity) - self._tokens) / self._rate)
+
+    def take(self, amount: float, now: float) -> None:
+        """Take `amount` from the bucket, which may go into debt. Negative amounts give back."""
+        self._refill(now)
+        self._tokens = min(self._capacity, self._tokens - amount)
+
+
+class RateGovernor:
+    """
+    Client-side rate limiting of the requests to an LLM provider, shared by the main agent and
+    its subagents.
+
+    Requests wait in the order they arrive until the request and token buckets allow them and
+    any delay the provider asked for with `Retry-After` or rate limit reset headers has passed.
+    After `circuit_breaker_threshold` consecutive outage errors (connection errors, timeouts
+    and 5xx responses), requests fail fast with `CircuitOpenError` for the cooldown, after which
+    a single request probes whether the provider has recovered.
+    """
+
+    def __init__(self, config: RateLimit):
+        self._config = config
+        self._requests = (
+            _TokenBucket(config.requests_per_minute) if config.requests_per_minute else None
+        )
+        self._tokens = _TokenBucket(config.tokens_per_minute) if config.tokens_per_minute else None
+        self._waiters = deque[asyncio.Future[None]]()
+        self._blocked_until = 0.0
+        self._n_failures = 0
+        self._open_until: float | None = None
+        self._probing = False
+
+    @asynccontextmanager
+    async def request(self, n_tokens: int = 0) -> AsyncIterator[None]:
+        """
+        Wait for the turn to send a request estimated to take `n_tokens` tokens, and record
+        the outcome of the request sent in the block.
+
+        Raises:
+            CircuitOpenError: If the provider is failing.
+        """
+        await self._acquire(n_tokens)
+        try:
+            yield
+        except asyncio.CancelledError:
+            # a cancelled probe tells nothing about the provider
+            self._probing = False
+            raise
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        else:
+            self._close_circuit()
+
+    def record_usage(self, n_tokens: int, estimated: int) -> None:
+        """Correct the token bucket once the actual token usage of a request is known."""
+        if self._tokens is not None:
+            self._tokens.take(n_tokens - estimated, time.monotonic())
+
+    async def _acquire(self, n_tokens: int) -> None:
+        self._check_circuit()
+        turn = asyncio.get_running_loop().create_future()
+        self._waiters.append(turn)
+        if len(self._waiters) == 1:
+            turn.set_result(None)
+        try:
+            await turn
+            self._check_circuit()
+            while (delay := self._delay(n_tokens)) > 0:
+                if delay > _LOG_WAIT_S:
+                    logger.info("Waiting {delay:.1f}s for the LLM rate limit", delay=delay)
+                await asyncio.sleep(delay)
+                self._check_circuit()
+            now = time.monotonic()
+            if self._requests is not None:
+                self._requests.take(1, now)
+            if self._tokens is not None:
+                self._tokens.take(n_tokens, now)
+            if self._open_until is not None:
+                self._probing = True
+        finally:
+            self._waiters.remove(turn)
+            if self._waiters and not self._waiters[0].done():
+                self._waiters[0].set_result(None)
+
+    def _delay(self, n_tokens: int) -> float:
+        now = time.monotonic()
+        delay = self._blocked_until - now
+        if self._requests is not None:
+            delay = max(delay, self._requests.delay(1, now))
+        if self._tokens is not None:
+            delay = max(delay, self._tokens.delay(n_tokens, now))
+        return delay
+
+    def _check_circuit(self) -> None:
+        if self._open_until is None:
+            return
+        remaining = self._open_until - time.monotonic()
+        if remaining > 0 or self._probing:
+            raise CircuitOpenError(
+                f"The LLM provider failed {self._n_failures} times in a row, "
+                f"not sending requests for {max(remaining, 0):.1f}s"
+            )
+
+    def _close_circuit(self) -> None:
+        if self._open_until is not None:
+            logger.info("LLM provider recovered, closing the circuit breaker")
+        self._n_failures = 0
+        self._open_until = None
+        self._probing = False
+
+    def _record_failure(self, error: Exception) -> None:
+        now = time.monotonic()
+        if (
+            isinstance(error, APIStatusError)
+            and error.status_code in _RETRY_AFTER_STATUS_CODES
+            and (delay := retry_after_s(error)) is not None
+        ):
+            logger.info("LLM provider asked to retry after {delay:.1f}s", delay=delay)
+            self._blocked_until = max(self._blocked_until, now + delay)
+        if not _is_outage(error):
+            # the provider is up, e.g. throttling or rejecting the request
+            self._close_circuit()
+            return
+        self._n_failures += 1
+        threshold = self._config.circuit_breaker_threshold
+        if self._probing or (threshold is not None and self._n_failures >= threshold):
+            logger.warning(
+                "LLM provider failed {n} times in a row, opening the circuit breaker for {s}s",
+                n=self._n_failures,
+                s=self._config.circuit_breaker_cooldown_s,
+            )
+            self._open_until = now + self._config.circuit_breaker_cooldown_s
+            self._probing = False
+
+
+def _is_outage(error: Exception) -> bool:
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code in _OUTAGE_STATUS_CODES
+
+
+def retry_after_s(error: BaseException) -> float | None:
+    """
+    The delay the provider asked for in the response headers of a failed request, if any.
+    The headers are read from the response of the SDK error the provider error was raised from.
+    """
+    response = getattr(error.__cause__, "response", None)
+    headers: Mapping[str, str] | None = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    delays: list[float] = []
+    if (value := headers.get("retry-after-ms")) is not None:
+        delays.extend(delay / 1000 for delay in _parse_seconds(value))
+    if (value := headers.get("retry-after")) is not None:
+        delays.extend(_parse_seconds(value) or _parse_http_date(value))
+    for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        if (value := headers.get(name)) is not None:
+            delays.extend(_parse_duration(value))
+    if not delays:
+        return None
+    return min(max(max(delays), 0.0), _MAX_RETRY_AFTER_S)
+
+
+def _parse_seconds(value: str) -> list[float]:
+    try:
+        return [float(value)]
+    except ValueError:
+        return []
+
+
+def _parse_http_date(value: str) -> list[float]:
+    try:
+        return [email.utils.parsedate_to_datetime(value).timestamp() - time.time()]
+    except (TypeError, ValueError):
+        return []
+
+
+def _parse_duration(value: str) -> list[float]:
+    """Parse durations like `1s`, `6m0s` or `20ms`."""
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts:
+        return _parse_seconds(value)
+    return [sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)]
+
+
+_governors: dict[tuple[Any, ...], RateGovernor] = {}
+"""Rate governors by provider endpoint, API key and rate limit configuration."""
+
+
+def get_rate_governor(provider: LLMProvider) -> RateGovernor:
+    """Get the rate governor shared by every LLM created from the same provider."""
+    key = (
+        provider.type,
+        provider.base_url,
+        hashlib.sha256(provider.api_key.get_secret_value().encode()).hexdigest(),
+        provider.rate_limit.model_dump_json(),
+    )
+    if (governor := _governors.get(key)) is None:
+        governor = _governors[key] = RateGovernor(provider.rate_limit)
+    return governor
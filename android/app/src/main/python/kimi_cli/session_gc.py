@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from kimi_cli.config import SessionRetention
+from kimi_cli.metadata import load_metadata
+from kimi_cli.share import get_share_dir
+from kimi_cli.utils.logging import logger
+from kimi_cli.utils.path import ROTATION_COUNTER_SUFFIX
+
+_SESSION_FILE_PATTERN = re.compile(
+    r"^(?P<session_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})"
+)
+_HISTORY_SUFFIX_PATTERN = re.compile(
+    r"(\.index\.jsonl|\.snapshot\.json|\.snapshot\.tmp|\.converting|\.jsonl|\.base(\.\d+)?)$"
+)
+"""Suffixes of a history file and of the files derived from it, including fork bases."""
+_ACTIVE_GRACE_S = 60 * 60
+"""Live history files modified more recently than this are never deleted for the byte budget."""
+
+
+@dataclass(slots=True)
+class SessionGCResult:
+    n_files: int = 0
+    n_bytes: int = 0
+
+
+@dataclass(slots=True)
+class _HistoryUnit:
+    """A history file together with its sidecar files."""
+
+    session_id: str
+    stem: str
+    paths: list[Path] = field(default_factory=list[Path])
+    size: int = 0
+    mtime: float = 0.0
+
+    @property
+    def live(self) -> bool:
+        """Whether this is the main history file of the session, rather than a rotation."""
+        return self.stem == self.session_id
+
+
+def _scan_sessions_dir(sessions_dir: Path) -> tuple[list[_HistoryUnit], dict[str, list[Path]]]:
+    units: dict[str, _HistoryUnit] = {}
+    counters: dict[str, list[Path]] = {}
+    with os.scandir(sessions_dir) as entries:
+        for entry in entries:
+            if not entry.is_file() or not (match := _SESSION_FILE_PATTERN.match(entry.name)):
+                continue
+            session_id = match.group("session_id")
+            if entry.name.endswith(ROTATION_COUNTER_SUFFIX):
+                counters.setdefault(session_id, []).append(Path(entry.path))
+                continue
+            if not (suffix := _HISTORY_SUFFIX_PATTERN.search(entry.name)):
+                continue
+            stem = entry.name[: suffix.start()]
+            unit = units.setdefault(stem, _HistoryUnit(session_id=session_id, stem=stem))
+            stat = entry.stat()
+            unit.paths.append(Path(entry.path))
+            unit.size += stat.st_size
+            unit.mtime = max(unit.mtime, stat.st_mtime)
+    return list(units.values()), counters
+
+
+def _delete_unit(unit: _HistoryUnit, result: SessionGCResult) -> None:
+    for path in unit.paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.warning("Failed to delete session file {path}: {error}", path=path, error=e)
+            continue
+        result.n_files += 1
+    result.n_bytes += unit.size
+
+
+def _collect(retention: SessionRetention, protected_session_ids: set[str]) -> SessionGCResult:
+    result = SessionGCResult()
+    sessions_root = get_share_dir() / "sessions"
+    if not sessions_root.is_dir():
+        return result
+
+    now = time.time()
+    kept: list[_HistoryUnit] = []
+    for sessions_dir in sessions_root.iterdir():
+        if not sessions_dir.is_dir():
+            continue
+        units, counters = _scan_sessions_dir(sessions_dir)
+        by_session: dict[str, list[_HistoryUnit]] = {}
+        for unit in units:
+            by_session.setdefault(unit.session_id, []).append(unit)
+
+        for session_id, session_units in by_session.items():
+            protected = session_id in protected_session_ids
+            newest = max(unit.mtime for unit in session_units)
+            if (
+                retention.max_age_days is not None
+                and not protected
+                and now - newest > retention.max_age_days * 24 * 60 * 60
+            ):
+                for unit in session_units:
+                    _delete_unit(unit, result)
+                continue
+
+            rotations = sorted(
+                (unit for unit in session_units if not unit.live),
+                key=lambda unit: unit.mtime,
+                reverse=True,
+            )
+            n_keep = len(rotations)
+            if retention.max_rotations_per_session is not None:
+                n_keep = min(n_keep, retention.max_rotations_per_session)
+            for unit in rotations[n_keep:]:
+                _delete_unit(unit, result)
+            kept.extend(unit for unit in session_units if unit.live)
+            kept.extend(rotations[:n_keep])
+
+        # counters of sessions without any history left are not needed any more
+        kept_session_ids = {unit.session_id for unit in kept}
+        for session_id, paths in counters.items():
+            if session_id not in kept_session_ids:
+                for path in paths:
+                    path.unlink(missing_ok=True)
+
+    if retention.max_total_bytes is not None:
+        total_bytes = sum(unit.size for unit in kept)
+        # rotations go first, then the live files of idle sessions, oldest first
+        candidates = sorted(
+            (
+                unit
+                for unit in kept
+                if not unit.live
+                or (
+                    unit.session_id not in protected_session_ids
+                    and now - unit.mtime > _ACTIVE_GRACE_S
+                )
+            ),
+            key=lambda unit: (unit.live, unit.mtime),
+        )
+        for unit in candidates:
+            if total_bytes <= retention.max_total_bytes:
+                break
+            _delete_unit(unit, result)
+            total_bytes -= unit.size
+
+    return result
+
+
+async def collect_session_garbage(
+    retention: SessionRetention, protected_session_ids: Iterable[str] = ()
+) -> SessionGCResult:
+    """
+    Delete session history files according to the retention policy.
+
+    The last session of every work directory and the given sessions are never deleted,
+    but their rotated and subagent history files are.
+    """
+    protected = set(protected_session_ids)
+    protected.update(
+        wd.last_session_id for wd in load_metadata().work_dirs if wd.last_session_id is not None
+    )
+    start = time.monotonic()
+    result = await asyncio.to_thread(_collect, retention, protected)
+    logger.info(
+        "Session GC deleted {n_files} files ({n_bytes} bytes) in {elapsed:.3f}s",
+        n_files=result.n_files,
+        n_bytes=result.n_bytes,
+        elapsed=time.monotonic() - start,
+    )
+    return result
+
+
+def start_session_gc(
+    retention: SessionRetention, protected_session_ids: Iterable[str] = ()
+) -> asyncio.Task[SessionGCResult | None]:
+    """Run the session GC in the background, logging instead of raising errors."""
+
+    async def _run() -> SessionGCResult | None:
+        try:
+            return await collect_session_garbage(retention, protected_session_ids)
+        except Exception as e:
+            logger.warning("Session GC failed: {error}", error=e)
+            return None
+
+    return asyncio.create_task(_run(), name="session-gc")
@@ -49,6 +49,8 @@ class MaxStepsReached(Exception):
 class StatusSnapshot:
     context_usage: float
     """The usage of the context, in percentage."""
+    cache_hit_rate: float | None = None
+    """The share of the input tokens of the last LLM request read from the prompt cache."""
 
 
 @runtime_checkable
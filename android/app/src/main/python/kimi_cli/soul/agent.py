@@ -15,10 +15,14 @@ from kimi_cli.session import Session
 from kimi_cli.soul.approval import Approval
 from kimi_cli.soul.denwarenji import DenwaRenji
 from kimi_cli.soul.runtime import BuiltinSystemPromptArgs, Runtime
+from kimi_cli.soul.tool_cache import ToolResultCache
 from kimi_cli.soul.toolset import CustomToolset
 from kimi_cli.tools import SkipThisTool
 from kimi_cli.utils.logging import logger
 
+_VOLATILE_BUILTIN_ARGS = ("KIMI_NOW", "KIMI_WORK_DIR_LS")
+"""Builtin args which change between sessions in the same directory."""
+
 
 @dataclass(frozen=True, slots=True, kw_only=True)
 class Agent:
@@ -27,6 +31,10 @@ class Agent:
     name: str
     system_prompt: str
     toolset: Toolset
+    environment: str | None = None
+    """
+    Volatile session data left out of the system prompt, to be sent after the history, if any.
+    """
 
 
 async def load_agent(
@@ -45,10 +53,12 @@ async def load_agent(
     logger.info("Loading agent: {agent_file}", agent_file=agent_file)
     agent_spec = load_agent_spec(agent_file)
 
+    stable_prefix = runtime.config.loop_control.prompt_layout == "stable_prefix"
     system_prompt = _load_system_prompt(
         agent_spec.system_prompt_path,
         agent_spec.system_prompt_args,
         runtime.builtin_args,
+        stable_prefix=stable_prefix,
     )
 
     tool_deps = {
@@ -64,7 +74,17 @@ async def load_agent(
     if agent_spec.exclude_tools:
         logger.debug("Excluding tools: {tools}", tools=agent_spec.exclude_tools)
         tools = [tool for tool in tools if tool not in agent_spec.exclude_tools]
-    toolset = CustomToolset()
+    tool_cache_config = runtime.config.tool_cache
+    toolset = CustomToolset(
+        max_concurrency=runtime.config.loop_control.max_parallel_tool_calls,
+        cache=ToolResultCache(
+            runtime.builtin_args.KIMI_WORK_DIR,
+            max_bytes=tool_cache_config.max_bytes,
+            max_entry_bytes=tool_cache_config.max_entry_bytes,
+        )
+        if tool_cache_config.enabled
+        else None,
+    )
     bad_tools = _load_tools(toolset, tools, tool_deps)
     if bad_tools:
         raise ValueError(f"Invalid tools: {bad_tools}")
@@ -77,12 +97,22 @@ async def load_agent(
         name=agent_spec.name,
         system_prompt=system_prompt,
         toolset=toolset,
+        environment=_load_environment(runtime.builtin_args) if stable_prefix else None,
     )
 
 
 def _load_system_prompt(
-    path: Path, args: dict[str, str], builtin_args: BuiltinSystemPromptArgs
+    path: Path,
+    args: dict[str, str],
+    builtin_args: BuiltinSystemPromptArgs,
+    *,
+    stable_prefix: bool = False,
 ) -> str:
+    """
+    Load the system prompt. With `stable_prefix`, the volatile builtin args are replaced by
+    references to the environment message, so that the prompt is the same for every session
+    in the same directory.
+    """
     logger.info("Loading system prompt: {path}", path=path)
     system_prompt = path.read_text(encoding="utf-8").strip()
     logger.debug(
@@ -90,7 +120,18 @@ def _load_system_prompt(
         builtin_args=builtin_args,
         spec_args=args,
     )
-    return string.Template(system_prompt).substitute(asdict(builtin_args), **args)
+    substitutions = asdict(builtin_args)
+    if stable_prefix:
+        for name in _VOLATILE_BUILTIN_ARGS:
+            substitutions[name] = f"<{name} in the environment message>"
+    return string.Template(system_prompt).substitute(substitutions, **args)
+
+
+def _load_environment(builtin_args: BuiltinSystemPromptArgs) -> str:
+    lines = ["Environment of the session, referred to by the system prompt:"]
+    for name in _VOLATILE_BUILTIN_ARGS:
+        lines.append(f"{name}:\n{getattr(builtin_args, name)}")
+    return "\n\n".join(lines)
 
 
 type ToolType = CallableTool | CallableTool2[Any]
@@ -159,6 +200,7 @@ async def _load_mcp_tools(
         logger.info("Loading MCP tools from: {mcp_config}", mcp_config=mcp_config)
         client = fastmcp.Client(mcp_config)
         async with client:
-            for tool in await client.list_tools():
+            # sorted, so that the tool schemas are sent in the same order in every session
+            for tool in sorted(await client.list_tools(), key=lambda tool: tool.name):
                 toolset += MCPTool(tool, client, runtime=runtime)
     return toolset
@@ -1,17 +1,34 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
+import math
+import re
+from collections import OrderedDict
 from collections.abc import Sequence
 from string import Template
 from typing import TYPE_CHECKING, Protocol, runtime_checkable
 
 from kosong import generate
-from kosong.message import ContentPart, Message, TextPart
+from kosong.message import ContentPart, ImageURLPart, Message, TextPart, ToolCall
 
 import kimi_cli.prompts as prompts
-from kimi_cli.llm import LLM
-from kimi_cli.soul.message import system
+from kimi_cli.llm import LLM, with_max_completion_tokens
+from kimi_cli.soul.message import is_checkpoint_message, system
+from kimi_cli.soul.tokens import HeuristicTokenEstimator, TokenEstimator, calibration_factor
 from kimi_cli.utils.logging import logger
 
+_COMPACTED_PREFIX = "Previous context has been compacted. Here is the compaction output:"
+_SUMMARY_PREFIX = "Summary of an earlier part of the conversation"
+_SUMMARY_PATTERN = re.compile(rf"^<system>({re.escape(_COMPACTED_PREFIX)}|{_SUMMARY_PREFIX}\b)")
+_PRUNED_PREFIX = "<system>Pruned output of "
+_KEY_ARGUMENTS = ("path", "command", "pattern", "url", "query", "subagent_name", "description")
+"""Tool call arguments that tell what a tool call was about, in order of preference."""
+_MAX_KEY_ARGUMENT_CHARS = 80
+_TRUNCATED_MESSAGE_OVERHEAD_TOKENS = 32
+"""Tokens taken by a truncated tool message besides its kept output."""
+
 
 @runtime_checkable
 class Compaction(Protocol):
@@ -33,76 +50,524 @@ class Compaction(Protocol):
 
 
 class SimpleCompaction(Compaction):
-    MAX_PRESERVED_MESSAGES = 2
+    """
+    Compact the context by summarizing it as a whole, except for the most recent messages
+    which fit in the preserved share of the context size, `LLM.preserved_context_ratio`.
+    """
 
-    async def compact(self, messages: Sequence[Message], llm: LLM) -> Sequence[Message]:
-        history = list(messages)
-        if not history:
-            return history
+    MAX_COMPLETION_TOKENS = 8_000
 
-        preserve_start_index = len(history)
-        n_preserved = 0
-        for index in range(len(history) - 1, -1, -1):
-            if history[index].role in {"user", "assistant"}:
-                n_preserved += 1
-                if n_preserved == self.MAX_PRESERVED_MESSAGES:
-                    preserve_start_index = index
-                    break
+    def __init__(self, token_estimator: TokenEstimator | None = None):
+        self._token_estimator = token_estimator or HeuristicTokenEstimator()
 
-        if n_preserved < self.MAX_PRESERVED_MESSAGES:
+    async def compact(self, messages: Sequence[Message], llm: LLM) -> Sequence[Message]:
+        history = list(messages)
+        preserve_start_index = _preserve_start_index(history, llm, self._token_estimator)
+        if preserve_start_index == 0:
             return history
 
         to_compact = history[:preserve_start_index]
-        to_preserve = history[preserve_start_index:]
+        to_preserve = _truncate_preserved(
+            history[preserve_start_index:], llm, self._token_estimator
+        )
 
         if not to_compact:
             # Let's hope this won't exceed the context size limit
             return to_preserve
 
-        # Convert history to string for the compact prompt
-        history_text = "\n\n".join(
-            f"## Message {i + 1}\nRole: {msg.role}\nContent: {msg.content}"
-            for i, msg in enumerate(to_compact)
-        )
-
         # Build the compact prompt using string template
         compact_template = Template(prompts.COMPACT)
-        compact_prompt = compact_template.substitute(CONTEXT=history_text)
-
-        # Create input message for compaction
-        compact_message = Message(role="user", content=compact_prompt)
+        compact_prompt = compact_template.substitute(CONTEXT=_render_messages(to_compact))
 
-        # Call generate to get the compacted context
-        # TODO: set max completion tokens
         logger.debug("Compacting context...")
-        result = await generate(
-            chat_provider=llm.chat_provider,
-            system_prompt="You are a helpful assistant that compacts conversation context.",
-            tools=[],
-            history=[compact_message],
+        content: list[ContentPart] = [system(_COMPACTED_PREFIX)]
+        content.extend(await _summarize(compact_prompt, llm, self.MAX_COMPLETION_TOKENS))
+        compacted_messages: list[Message] = [Message(role="assistant", content=content)]
+        compacted_messages.extend(to_preserve)
+        return compacted_messages
+
+
+class RollingCompaction(Compaction):
+    """
+    Compact the context incrementally, summarizing only what is new since the last compaction.
+
+    The messages before the preserved ones are split at checkpoints into segments of about
+    `SEGMENT_TOKENS` tokens, and every segment is summarized on its own, with the summaries of
+    the earlier segments as reference. The summaries are kept in the compacted messages, so
+    the next compaction recognizes them and starts from the first unsummarized segment. They
+    are also cached by the content of their segment, for retries and reverted compactions.
+    When there are more than `MAX_SUMMARIES` summaries, they are merged into one.
+    """
+
+    SEGMENT_TOKENS = 16_000
+    MAX_SUMMARIES = 4
+    MAX_CACHED_SUMMARIES = 32
+    MAX_COMPLETION_TOKENS = 8_000
+
+    def __init__(self, token_estimator: TokenEstimator | None = None):
+        self._token_estimator = token_estimator or HeuristicTokenEstimator()
+        self._summaries: OrderedDict[str, Message] = OrderedDict()
+        """Cached summaries, by the key of their segment."""
+
+    async def compact(self, messages: Sequence[Message], llm: LLM) -> Sequence[Message]:
+        history = list(messages)
+        preserve_start_index = _preserve_start_index(history, llm, self._token_estimator)
+        if preserve_start_index == 0:
+            return history
+
+        # summaries of earlier compactions lead the history, possibly after a checkpoint
+        summaries: list[Message] = []
+        start_index = 0
+        while start_index < preserve_start_index and (
+            _is_summary(history[start_index]) or is_checkpoint_message(history[start_index])
+        ):
+            if _is_summary(history[start_index]):
+                summaries.append(history[start_index])
+            start_index += 1
+
+        segments = self._split_segments(history[start_index:preserve_start_index])
+        logger.debug(
+            "Compacting context: {n_summaries} summaries, {n_segments} new segments",
+            n_summaries=len(summaries),
+            n_segments=len(segments),
+        )
+        for segment in segments:
+            summaries.append(await self._summarize_segment(segment, summaries, llm))
+        if len(summaries) > self.MAX_SUMMARIES:
+            summaries = [await self._merge_summaries(summaries, llm)]
+        to_preserve = _truncate_preserved(
+            history[preserve_start_index:], llm, self._token_estimator
         )
-        if result.usage:
-            logger.debug(
-                "Compaction used {input} input tokens and {output} output tokens",
-                input=result.usage.input,
-                output=result.usage.output,
+        return [*summaries, *to_preserve]
+
+    def _split_segments(self, messages: Sequence[Message]) -> list[list[Message]]:
+        segments: list[list[Message]] = []
+        segment: list[Message] = []
+        n_tokens = 0
+        for message in messages:
+            if is_checkpoint_message(message):
+                if n_tokens >= self.SEGMENT_TOKENS:
+                    segments.append(segment)
+                    segment, n_tokens = [], 0
+                continue
+            segment.append(message)
+            n_tokens += self._token_estimator.estimate(message)
+        if segment:
+            segments.append(segment)
+        return segments
+
+    async def _summarize_segment(
+        self, segment: Sequence[Message], summaries: Sequence[Message], llm: LLM
+    ) -> Message:
+        key = _segment_key(segment)
+        if (summary := self._get_cached(key)) is not None:
+            logger.debug("Reusing the summary of segment {key}", key=key)
+            return summary
+        prompt = Template(prompts.COMPACT_SEGMENT).substitute(
+            SUMMARIES=_render_messages(summaries) if summaries else "(none)",
+            CONTEXT=_render_messages(segment),
+        )
+        summary = _summary_message(key, await _summarize(prompt, llm, self.MAX_COMPLETION_TOKENS))
+        self._put_cached(key, summary)
+        return summary
+
+    async def _merge_summaries(self, summaries: Sequence[Message], llm: LLM) -> Message:
+        key = _segment_key(summaries)
+        if (summary := self._get_cached(key)) is not None:
+            return summary
+        logger.debug("Merging {n} summaries", n=len(summaries))
+        prompt = Template(prompts.COMPACT).substitute(CONTEXT=_render_messages(summaries))
+        summary = _summary_message(key, await _summarize(prompt, llm, self.MAX_COMPLETION_TOKENS))
+        self._put_cached(key, summary)
+        return summary
+
+    def _get_cached(self, key: str) -> Message | None:
+        if (summary := self._summaries.get(key)) is not None:
+            self._summaries.move_to_end(key)
+        return summary
+
+    def _put_cached(self, key: str, summary: Message) -> None:
+        self._summaries[key] = summary
+        while len(self._summaries) > self.MAX_CACHED_SUMMARIES:
+            self._summaries.popitem(last=False)
+
+
+class PruningCompaction(Compaction):
+    """
+    Compact the context without calling the model, by replacing stale tool outputs with
+    short stubs that keep the tool name, its key argument and the output size.
+
+    Tool outputs are stale when they are older than `KEEP_RECENT_STEPS` steps, or larger than
+    `MAX_OUTPUT_TOKENS` and not from the last step. The tool messages themselves are kept, so
+    every tool call still has its result. If the pruned context is still estimated above
+    `TARGET_USAGE` of the context size, it is passed on to the fallback compaction.
+    """
+
+    KEEP_RECENT_STEPS = 4
+    MAX_OUTPUT_TOKENS = 4_000
+    TARGET_USAGE = 0.5
+
+    def __init__(
+        self,
+        fallback: Compaction | None = None,
+        *,
+        token_estimator: TokenEstimator | None = None,
+    ):
+        self._fallback = fallback
+        self._token_estimator = token_estimator or HeuristicTokenEstimator()
+
+    async def compact(self, messages: Sequence[Message], llm: LLM) -> Sequence[Message]:
+        # checkpoints are gone after compaction, so are the messages telling their IDs
+        history = [message for message in messages if not is_checkpoint_message(message)]
+        tool_calls = {
+            tool_call.id: tool_call
+            for message in history
+            if message.role == "assistant"
+            for tool_call in message.tool_calls or []
+        }
+
+        n_steps = 0
+        n_pruned = 0
+        pruned: list[Message] = []
+        for message in reversed(history):
+            if message.role == "assistant":
+                n_steps += 1
+            elif (
+                message.role == "tool"
+                and n_steps > 0
+                and not _first_text(message).startswith(_PRUNED_PREFIX)
+                and (
+                    n_steps >= self.KEEP_RECENT_STEPS
+                    or self._token_estimator.estimate(message) > self.MAX_OUTPUT_TOKENS
+                )
+            ):
+                message = _pruned_tool_message(message, tool_calls.get(message.tool_call_id or ""))
+                n_pruned += 1
+            pruned.append(message)
+        pruned.reverse()
+
+        n_tokens = math.ceil(
+            sum(self._token_estimator.estimate(message) for message in pruned)
+            * calibration_factor(llm.chat_provider.model_name)
+        )
+        logger.debug(
+            "Pruned {n_pruned} tool outputs, about {n_tokens} tokens left",
+            n_pruned=n_pruned,
+            n_tokens=n_tokens,
+        )
+        if self._fallback is not None and n_tokens > self.TARGET_USAGE * llm.max_context_size:
+            logger.debug("Pruning did not free enough context, falling back")
+            return await self._fallback.compact(pruned, llm)
+        return pruned
+
+
+def _pruned_tool_message(message: Message, tool_call: ToolCall | None) -> Message:
+    if isinstance(message.content, str):
+        n_chars, n_images = len(message.content), 0
+    else:
+        n_chars = sum(len(part.text) for part in message.content if isinstance(part, TextPart))
+        n_images = sum(isinstance(part, ImageURLPart) for part in message.content)
+
+    name = tool_call.function.name if tool_call is not None else "unknown tool"
+    key_argument = _key_argument(tool_call) if tool_call is not None else None
+    call = f"{name}({key_argument})" if key_argument else name
+    size = f"{n_chars} chars" + (f", {n_images} images" if n_images else "")
+    return Message(
+        role="tool",
+        content=[
+            TextPart(
+                text=f"{_PRUNED_PREFIX}{call} ({size}) to save context. "
+                "Call the tool again if it is still needed.</system>"
             )
+        ],
+        tool_call_id=message.tool_call_id,
+    )
+
+
+def _key_argument(tool_call: ToolCall) -> str | None:
+    try:
+        arguments = json.loads(tool_call.function.arguments or "{}")
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(arguments, dict):
+        return None
+    value = next(
+        (arguments[key] for key in _KEY_ARGUMENTS if isinstance(arguments.get(key), str)),
+        next((v for v in arguments.values() if isinstance(v, str)), None),
+    )
+    if value is None:
+        return None
+    value = " ".join(value.split())
+    if len(value) > _MAX_KEY_ARGUMENT_CHARS:
+        value = value[: _MAX_KEY_ARGUMENT_CHARS - 3] + "..."
+    return json.dumps(value, ensure_ascii=False)
+
+
+class ChunkedCompaction(Compaction):
+    """
+    Compact the context with a map-reduce over chunks of the history, so that histories
+    larger than the model window can be compacted too.
+
+    The messages before the preserved ones are split into chunks of at most `CHUNK_TOKENS`
+    tokens (and at most `MAX_CHUNK_USAGE` of the context size), with every tool output
+    truncated to `MAX_TOOL_OUTPUT_TOKENS`. The chunks are summarized concurrently, at most
+    `MAX_PARALLEL_CHUNKS` at a time, and the partial summaries are merged into one, in rounds
+    if they do not fit in one chunk either. Only a single chunk is ever sent to the model.
+    """
 
-        content: list[ContentPart] = [
-            system("Previous context has been compacted. Here is the compaction output:")
+    CHUNK_TOKENS = 32_000
+    MAX_CHUNK_USAGE = 0.5
+    MAX_TOOL_OUTPUT_TOKENS = 2_000
+    MAX_PARALLEL_CHUNKS = 4
+    MAP_COMPLETION_TOKENS = 2_000
+    REDUCE_COMPLETION_TOKENS = 8_000
+
+    def __init__(self, token_estimator: TokenEstimator | None = None):
+        self._token_estimator = token_estimator or HeuristicTokenEstimator()
+
+    async def compact(self, messages: Sequence[Message], llm: LLM) -> Sequence[Message]:
+        history = list(messages)
+        preserve_start_index = _preserve_start_index(history, llm, self._token_estimator)
+        if preserve_start_index == 0:
+            return history
+
+        to_compact = history[:preserve_start_index]
+        to_preserve = _truncate_preserved(
+            history[preserve_start_index:], llm, self._token_estimator
+        )
+
+        max_chunk_tokens = min(self.CHUNK_TOKENS, int(llm.max_context_size * self.MAX_CHUNK_USAGE))
+        texts = [
+            _truncate_text(
+                _message_text(message),
+                self.MAX_TOOL_OUTPUT_TOKENS if message.role == "tool" else max_chunk_tokens,
+            )
+            for message in to_compact
+            if not is_checkpoint_message(message)
         ]
-        compacted_msg = result.message
-        content.extend(
-            [TextPart(text=compacted_msg.content)]
-            if isinstance(compacted_msg.content, str)
-            else compacted_msg.content
+        chunks = self._chunk(
+            [f"## Message {i + 1}\n{text}" for i, text in enumerate(texts)], max_chunk_tokens
         )
-        compacted_messages: list[Message] = [Message(role="assistant", content=content)]
-        compacted_messages.extend(to_preserve)
-        return compacted_messages
+        logger.debug("Compacting context in {n} chunks...", n=len(chunks))
+
+        semaphore = asyncio.Semaphore(self.MAX_PARALLEL_CHUNKS)
+
+        async def _summarize_chunk(chunk: str, prompt_template: str, max_tokens: int) -> str:
+            async with semaphore:
+                prompt = Template(prompt_template).substitute(
+                    SUMMARIES="(Summarized separately.)", CONTEXT=chunk
+                )
+                return _parts_text(await _summarize(prompt, llm, max_tokens))
+
+        if len(chunks) == 1:
+            summary = await _summarize_chunk(
+                chunks[0], prompts.COMPACT, self.REDUCE_COMPLETION_TOKENS
+            )
+        else:
+            partials = await asyncio.gather(
+                *(
+                    _summarize_chunk(chunk, prompts.COMPACT_SEGMENT, self.MAP_COMPLETION_TOKENS)
+                    for chunk in chunks
+                )
+            )
+            texts = [f"## Part {i + 1}\n{partial}" for i, partial in enumerate(partials)]
+            # the partial summaries do not fit in one chunk, merge them in rounds
+            while len(chunks := self._chunk(texts, max_chunk_tokens)) > 1:
+                if len(chunks) == len(texts):
+                    # not even two of them fit in one chunk, truncate them to merge them in pairs
+                    max_text_tokens = max_chunk_tokens // 2 - _TRUNCATED_MESSAGE_OVERHEAD_TOKENS
+                    texts = [_truncate_text(text, max_text_tokens) for text in texts]
+                    chunks = self._chunk(texts, max_chunk_tokens)
+                partials = await asyncio.gather(
+                    *(
+                        _summarize_chunk(chunk, prompts.COMPACT, self.MAP_COMPLETION_TOKENS)
+                        for chunk in chunks
+                    )
+                )
+                texts = [f"## Part {i + 1}\n{partial}" for i, partial in enumerate(partials)]
+            summary = await _summarize_chunk(
+                _truncate_text(chunks[0], max_chunk_tokens),
+                prompts.COMPACT,
+                self.REDUCE_COMPLETION_TOKENS,
+            )
+
+        content: list[ContentPart] = [system(_COMPACTED_PREFIX), TextPart(text=summary)]
+        return [Message(role="assistant", content=content), *to_preserve]
+
+    @staticmethod
+    def _chunk(texts: Sequence[str], max_tokens: int) -> list[str]:
+        chunks: list[list[str]] = [[]]
+        n_tokens = 0
+        for text in texts:
+            text_tokens = HeuristicTokenEstimator.estimate_text(text)
+            if chunks[-1] and n_tokens + text_tokens > max_tokens:
+                chunks.append([])
+                n_tokens = 0
+            chunks[-1].append(text)
+            n_tokens += text_tokens
+        return ["\n\n".join(chunk) for chunk in chunks]
+
+
+def _truncate_text(text: str, max_tokens: int) -> str:
+    n_tokens = HeuristicTokenEstimator.estimate_text(text)
+    if n_tokens <= max_tokens:
+        return text
+    # keep the head and the tail, which usually tell the most about an output
+    n_chars = len(text) * max_tokens // n_tokens // 2
+    n_truncated = len(text) - 2 * n_chars
+    return f"{text[:n_chars]}\n[... {n_truncated} chars truncated ...]\n{text[-n_chars:]}"
+
+
+def _message_text(message: Message) -> str:
+    """Render a message as plain text for the compact prompts."""
+    lines = [f"Role: {message.role}"]
+    if isinstance(message.content, str):
+        lines.append(message.content)
+    else:
+        for part in message.content:
+            if isinstance(part, TextPart):
+                lines.append(part.text)
+            elif isinstance(part, ImageURLPart):
+                lines.append("[image]")
+    for tool_call in message.tool_calls or []:
+        lines.append(f"Tool call: {tool_call.function.name}({tool_call.function.arguments or ''})")
+    return "\n".join(lines)
+
+
+def _parts_text(parts: Sequence[ContentPart]) -> str:
+    return "".join(part.text for part in parts if isinstance(part, TextPart))
+
+
+def _preserved_budget(llm: LLM) -> float:
+    """The estimated tokens the preserved messages may take."""
+    return llm.preserved_context_ratio * llm.max_context_size / calibration_factor(llm.model_name)
+
+
+def _preserve_start_index(
+    history: Sequence[Message], llm: LLM, token_estimator: TokenEstimator
+) -> int:
+    """
+    Find where the preserved messages start: the latest user or assistant message and
+    everything after it, which carry the request in progress, together with the older
+    messages that still fit in the preserved share of the context size. The preserved
+    messages start with a user or assistant message, so that every tool result among them
+    comes with its tool call.
+    """
+    budget = _preserved_budget(llm)
+    n_tokens = 0
+    preserve_start_index = len(history)
+    for index in range(len(history) - 1, -1, -1):
+        message = history[index]
+        n_tokens += token_estimator.estimate(message)
+        found = preserve_start_index < len(history)
+        if found and n_tokens > budget:
+            break
+        if message.role not in {"user", "assistant"}:
+            continue
+        if found or not is_checkpoint_message(message):
+            preserve_start_index = index
+    return preserve_start_index
+
+
+def _truncate_preserved(
+    messages: Sequence[Message], llm: LLM, token_estimator: TokenEstimator
+) -> list[Message]:
+    """
+    Truncate the tool outputs among the preserved messages when they are over the preserved
+    share of the context size, e.g. because of a large tool output in the last step.
+    """
+    budget = _preserved_budget(llm)
+    estimates = [token_estimator.estimate(message) for message in messages]
+    if sum(estimates) <= budget:
+        return list(messages)
+    n_tool_messages = sum(message.role == "tool" for message in messages)
+    other_tokens = sum(
+        n_tokens
+        for message, n_tokens in zip(messages, estimates, strict=True)
+        if message.role != "tool"
+    )
+    max_tool_tokens = max(
+        int((budget - other_tokens) / max(n_tool_messages, 1)) - _TRUNCATED_MESSAGE_OVERHEAD_TOKENS,
+        1,
+    )
+    return [
+        _truncate_tool_message(message, max_tool_tokens) if message.role == "tool" else message
+        for message in messages
+    ]
+
+
+def _truncate_tool_message(message: Message, max_tokens: int) -> Message:
+    if isinstance(message.content, str):
+        content: str | list[ContentPart] = _truncate_text(message.content, max_tokens)
+    else:
+        n_text_parts = sum(isinstance(part, TextPart) for part in message.content)
+        content = [
+            TextPart(text=_truncate_text(part.text, max(max_tokens // n_text_parts, 1)))
+            if isinstance(part, TextPart)
+            else part
+            for part in message.content
+        ]
+    return message.model_copy(update={"content": content})
+
+
+def _render_messages(messages: Sequence[Message]) -> str:
+    """Convert messages to string for the compact prompts."""
+    return "\n\n".join(
+        f"## Message {i + 1}\nRole: {msg.role}\nContent: {msg.content}"
+        for i, msg in enumerate(messages)
+    )
+
+
+async def _summarize(prompt: str, llm: LLM, max_completion_tokens: int) -> list[ContentPart]:
+    result = await generate(
+        chat_provider=with_max_completion_tokens(llm.chat_provider, max_completion_tokens),
+        system_prompt="You are a helpful assistant that compacts conversation context.",
+        tools=[],
+        history=[Message(role="user", content=prompt)],
+    )
+    if result.usage:
+        logger.debug(
+            "Compaction used {input} input tokens and {output} output tokens",
+            input=result.usage.input,
+            output=result.usage.output,
+        )
+    content = result.message.content
+    return [TextPart(text=content)] if isinstance(content, str) else list(content)
+
+
+def _summary_message(key: str, content: Sequence[ContentPart]) -> Message:
+    return Message(role="assistant", content=[system(f"{_SUMMARY_PREFIX} ({key}):"), *content])
+
+
+def _segment_key(messages: Sequence[Message]) -> str:
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(message.model_dump_json(exclude_none=True).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()[:16]
+
+
+def _first_text(message: Message) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    if message.content and isinstance(part := message.content[0], TextPart):
+        return part.text
+    return ""
+
+
+def _is_summary(message: Message) -> bool:
+    return message.role == "assistant" and bool(_SUMMARY_PATTERN.match(_first_text(message)))
 
 
 if TYPE_CHECKING:
 
-    def type_check(simple: SimpleCompaction):
+    def type_check(
+        simple: SimpleCompaction,
+        rolling: RollingCompaction,
+        pruning: PruningCompaction,
+        chunked: ChunkedCompaction,
+    ):
         _: Compaction = simple
+        _: Compaction = rolling
+        _: Compaction = pruning
+        _: Compaction = chunked
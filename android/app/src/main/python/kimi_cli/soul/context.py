@@ -1,25 +1,129 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import hashlib
 import json
+import os
 from collections.abc import Sequence
+from dataclasses import asdict, dataclass, replace
 from pathlib import Path
 
 import aiofiles
 import aiofiles.os
 from kosong.message import Message
+from pydantic import BaseModel
 
+from kimi_cli.config import ContextStorage
+from kimi_cli.soul.history import (
+    BufferedWriter,
+    HistoryFormat,
+    compress,
+    convert_history,
+    decompress,
+    detect_history_format,
+    open_history_writer,
+    read_history_records,
+)
 from kimi_cli.soul.message import system
+from kimi_cli.soul.tokens import HeuristicTokenEstimator, TokenEstimator
 from kimi_cli.utils.logging import logger
 from kimi_cli.utils.path import next_available_rotation
 
 
+@dataclass(frozen=True, slots=True)
+class _CheckpointIndexEntry:
+    """Where a checkpoint lives in the history file and the context state right before it."""
+
+    id: int
+    offset: int
+    """Byte offset of the `_checkpoint` record in the history file."""
+    n_messages: int
+    token_count: int
+    n_counted_messages: int = 0
+    """Number of leading messages covered by `token_count`."""
+    base_level: int | None = None
+    """The base file the checkpoint is in for a forked context, `None` for its own file."""
+
+
+_SNAPSHOT_VERSION = 2
+_SNAPSHOT_GROWTH = 0.25
+"""
+A new snapshot is written only after the history grew by this share of the latest snapshot,
+so that the bytes written for snapshots stay within about 5 times the bytes appended.
+"""
+_FINGERPRINT_BYTES = 4096
+
+
+class _ContextSnapshot(BaseModel):
+    """The parsed context state covering the first `offset` bytes of the history file."""
+
+    version: int = _SNAPSHOT_VERSION
+    offset: int
+    fingerprint: str
+    """Hash of the bytes right before `offset`, to detect a rewritten history file."""
+    token_count: int
+    n_counted_messages: int
+    next_checkpoint_id: int
+    history: list[Message]
+
+
+def _encode_index_entry(entry: _CheckpointIndexEntry) -> bytes:
+    return json.dumps(asdict(entry)).encode("utf-8") + b"\n"
+
+
+def _fingerprint(path: Path, offset: int) -> str:
+    start = max(offset - _FINGERPRINT_BYTES, 0)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+def _copy_file_prefix(src: Path, dst: Path, n_bytes: int) -> None:
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        while n_bytes > 0:
+            chunk = fsrc.read(min(n_bytes, 1 << 20))
+            if not chunk:
+                break
+            fdst.write(chunk)
+            n_bytes -= len(chunk)
+
+
 class Context:
-    def __init__(self, file_backend: Path):
+    def __init__(
+        self,
+        file_backend: Path,
+        *,
+        storage: ContextStorage | None = None,
+        token_estimator: TokenEstimator | None = None,
+    ):
         self._file_backend = file_backend
+        self._storage = storage or ContextStorage()
+        self._token_estimator = token_estimator or HeuristicTokenEstimator()
+        self._writer = open_history_writer(file_backend, self._storage.format)
+        self._index_file = file_backend.with_suffix(".index.jsonl")
+        """Sidecar file of checkpoint index entries, one JSON object per line."""
+        self._index_writer = BufferedWriter(self._index_file, truncate=True)
+        self._checkpoints: list[_CheckpointIndexEntry] = []
+        """Index entries of the current checkpoints; the list index is the checkpoint ID."""
+        self._snapshot_file = file_backend.with_suffix(".snapshot.json")
+        self._snapshot_offset: int = 0
+        """The history file offset covered by the latest snapshot."""
+        self._snapshot_bytes: int = 0
+        """The size of the latest snapshot file."""
+        self._snapshot_lock = asyncio.Lock()
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._flush_task: asyncio.Task[None] | None = None
         self._history: list[Message] = []
         self._token_count: int = 0
+        self._n_counted_messages: int = 0
+        """Number of leading messages covered by the token count reported by the provider."""
+        self._token_estimates: dict[int, int] = {}
+        """Cached token estimates of the messages not covered by the token count, by index."""
         self._next_checkpoint_id: int = 0
         """The ID of the next checkpoint, starting from 0, incremented after each checkpoint."""
+        self._generation: int = 0
+        """Incremented whenever earlier history is rewritten, e.g. by a revert or compaction."""
 
     async def restore(self) -> bool:
         logger.debug("Restoring context from file: {file_backend}", file_backend=self._file_backend)
@@ -28,26 +132,258 @@ class Context:
             raise RuntimeError("The context storage is already modified")
         if not self._file_backend.exists():
             logger.debug("No context file found, skipping restoration")
+            await self._discard_snapshot()
             return False
         if self._file_backend.stat().st_size == 0:
             logger.debug("Empty context file, skipping restoration")
+            await self._discard_snapshot()
             return False
 
-        async with aiofiles.open(self._file_backend, encoding="utf-8") as f:
-            async for line in f:
-                if not line.strip():
+        file_format = detect_history_format(self._file_backend)
+        if file_format is not None and file_format != self._storage.format:
+            await self._convert_file_backend(file_format, self._storage.format)
+
+        offset = 0
+        if (snapshot := await self._load_snapshot()) is not None:
+            snapshot, checkpoints = snapshot
+            self._history.extend(snapshot.history)
+            self._token_count = snapshot.token_count
+            self._n_counted_messages = snapshot.n_counted_messages
+            self._next_checkpoint_id = snapshot.next_checkpoint_id
+            self._checkpoints.extend(checkpoints)
+            self._snapshot_offset = offset = snapshot.offset
+            self._snapshot_bytes = self._snapshot_file.stat().st_size
+            logger.debug(
+                "Loaded context snapshot, replaying history after offset {offset}", offset=offset
+            )
+
+        # replay the records which are not covered by the snapshot
+        await self._replay(self._file_backend, offset)
+
+        if await self._read_index() == self._checkpoints:
+            self._index_writer = BufferedWriter(self._index_file)
+        else:
+            logger.debug("Rebuilding checkpoint index: {index_file}", index_file=self._index_file)
+            for entry in self._checkpoints:
+                self._index_writer.write(_encode_index_entry(entry))
+            await self._index_writer.flush()
+
+        return True
+
+    async def _replay(
+        self,
+        path: Path,
+        offset: int,
+        end: int | None = None,
+        base_level: int | None = None,
+    ) -> None:
+        """
+        Apply the records of a history file between two byte offsets to the context.
+
+        Args:
+            path (Path): The history file, either the own file or a base file.
+            offset (int): The offset to start replaying from.
+            end (int | None): The offset to stop replaying at, `None` for the end of file.
+            base_level (int | None): The level of the base file, `None` for the own file.
+        """
+        async with contextlib.aclosing(read_history_records(path, offset)) as records:
+            async for record_offset, record in records:
+                if end is not None and record_offset >= end:
+                    break
+                record_json = json.loads(record)
+                if record_json["role"] == "_usage":
+                    self._token_count = record_json["token_count"]
+                    self._n_counted_messages = len(self._history)
                     continue
-                line_json = json.loads(line)
-                if line_json["role"] == "_usage":
-                    self._token_count = line_json["token_count"]
+                if record_json["role"] == "_checkpoint":
+                    self._next_checkpoint_id = record_json["id"] + 1
+                    self._checkpoints.append(
+                        _CheckpointIndexEntry(
+                            id=record_json["id"],
+                            offset=record_offset,
+                            n_messages=len(self._history),
+                            token_count=self._token_count,
+                            n_counted_messages=self._n_counted_messages,
+                            base_level=base_level,
+                        )
+                    )
                     continue
-                if line_json["role"] == "_checkpoint":
-                    self._next_checkpoint_id = line_json["id"] + 1
+                if record_json["role"] == "_fork":
+                    # levels in the record are relative to the file it is in
+                    level = record_json["level"] + (0 if base_level is None else base_level + 1)
+                    await self._replay(
+                        self._base_file(level), 0, record_json["offset"], base_level=level
+                    )
                     continue
-                message = Message.model_validate(line_json)
+                message = Message.model_validate(record_json)
                 self._history.append(message)
 
-        return True
+    def _base_file(self, level: int) -> Path:
+        """
+        The hard link to the history file a forked context shares its prefix with. Level 0
+        is the parent's file, level 1 the grandparent's, and so on.
+        """
+        return self._file_backend.with_suffix(".base" if level == 0 else f".base.{level}")
+
+    async def fork(self, file_backend: Path) -> Context:
+        """
+        Fork the context into a new file backend.
+
+        The fork shares the current messages with this context in memory, and the current
+        history file on disk through a hard link plus a byte offset, so it only stores what
+        is appended to it afterwards. Nothing is written to `file_backend` until it is flushed.
+
+        Raises:
+            ValueError: When the file backend already has content.
+        """
+        if file_backend.exists() and file_backend.stat().st_size > 0:
+            raise ValueError(f"History file already exists: {file_backend}")
+        await self.flush()
+        offset = self._writer.offset
+
+        child = Context(file_backend, storage=self._storage, token_estimator=self._token_estimator)
+
+        def _link_bases() -> None:
+            self._file_backend.touch()
+            sources = [self._file_backend]
+            while (base_file := self._base_file(len(sources) - 1)).exists():
+                sources.append(base_file)
+            for level, source in enumerate(sources):
+                target = child._base_file(level)
+                target.unlink(missing_ok=True)
+                try:
+                    os.link(source, target)
+                except OSError:
+                    # no hard links on this file system, fall back to copying
+                    size = offset if level == 0 else source.stat().st_size
+                    _copy_file_prefix(source, target, size)
+
+        await asyncio.to_thread(_link_bases)
+
+        child._history = list(self._history)
+        child._token_count = self._token_count
+        child._n_counted_messages = self._n_counted_messages
+        child._token_estimates = dict(self._token_estimates)
+        child._next_checkpoint_id = self._next_checkpoint_id
+        child._checkpoints = [
+            replace(
+                entry, base_level=0 if entry.base_level is None else entry.base_level + 1
+            )
+            for entry in self._checkpoints
+        ]
+        child._writer.append(
+            json.dumps({"role": "_fork", "level": 0, "offset": offset}).encode("utf-8")
+        )
+        for entry in child._checkpoints:
+            child._index_writer.write(_encode_index_entry(entry))
+        logger.debug(
+            "Forked context {file_backend} into {child}",
+            file_backend=self._file_backend,
+            child=file_backend,
+        )
+        return child
+
+    async def _convert_file_backend(self, src: HistoryFormat, dst: HistoryFormat) -> None:
+        logger.info(
+            "Converting history file from {src} to {dst}: {file_backend}",
+            src=src,
+            dst=dst,
+            file_backend=self._file_backend,
+        )
+        await self._writer.close()
+        tmp_file = self._file_backend.with_suffix(".converting")
+        await convert_history(self._file_backend, tmp_file, dst)
+        await aiofiles.os.replace(tmp_file, self._file_backend)
+        # offsets have changed, the index is rebuilt by the caller
+        await self._discard_snapshot()
+        self._writer = open_history_writer(self._file_backend, dst)
+
+    async def _load_snapshot(
+        self,
+    ) -> tuple[_ContextSnapshot, list[_CheckpointIndexEntry]] | None:
+        """Load the snapshot with the index entries it covers, if it is still valid."""
+
+        def _load() -> _ContextSnapshot | None:
+            try:
+                data = self._snapshot_file.read_bytes()
+                if data[:1] != b"{":
+                    data = decompress(data[0], data[1:])
+                snapshot = _ContextSnapshot.model_validate_json(data)
+            except (OSError, IndexError, ValueError):
+                return None
+            if (
+                snapshot.version != _SNAPSHOT_VERSION
+                or snapshot.offset > self._file_backend.stat().st_size
+                or snapshot.fingerprint != _fingerprint(self._file_backend, snapshot.offset)
+            ):
+                return None
+            return snapshot
+
+        if (snapshot := await asyncio.to_thread(_load)) is None:
+            logger.debug("No valid context snapshot: {file}", file=self._snapshot_file)
+            return None
+        checkpoints = [
+            entry
+            for entry in await self._read_index() or []
+            if entry.base_level is not None or entry.offset < snapshot.offset
+        ]
+        if [entry.id for entry in checkpoints] != list(range(snapshot.next_checkpoint_id)):
+            logger.debug("Checkpoint index does not match the context snapshot")
+            return None
+        return snapshot, checkpoints
+
+    async def snapshot(self) -> None:
+        """Flush buffered records and snapshot the current state for fast restoration."""
+        await self._writer.flush()
+        await self._write_snapshot()
+
+    async def _write_snapshot(self) -> None:
+        async with self._snapshot_lock:
+            if self._writer.pending:
+                # only a state fully written to the file can be snapshotted
+                return
+            snapshot = _ContextSnapshot.model_construct(
+                version=_SNAPSHOT_VERSION,
+                offset=self._writer.offset,
+                fingerprint="",
+                token_count=self._token_count,
+                n_counted_messages=self._n_counted_messages,
+                next_checkpoint_id=self._next_checkpoint_id,
+                history=list(self._history),
+            )
+
+            def _write() -> int:
+                snapshot.fingerprint = _fingerprint(self._file_backend, snapshot.offset)
+                tmp_file = self._snapshot_file.with_suffix(".tmp")
+                data = snapshot.model_dump_json(exclude_none=True).encode("utf-8")
+                if self._storage.format == "binary":
+                    codec, payload = compress(data)
+                    data = bytes([codec]) + payload
+                tmp_file.write_bytes(data)
+                os.replace(tmp_file, self._snapshot_file)
+                return len(data)
+
+            self._snapshot_bytes = await asyncio.to_thread(_write)
+            self._snapshot_offset = snapshot.offset
+            logger.debug("Wrote context snapshot at offset {offset}", offset=snapshot.offset)
+
+    async def _discard_snapshot(self) -> None:
+        if await aiofiles.os.path.exists(self._snapshot_file):
+            await aiofiles.os.remove(self._snapshot_file)
+        self._snapshot_offset = 0
+        self._snapshot_bytes = 0
+
+    async def _read_index(self) -> list[_CheckpointIndexEntry] | None:
+        try:
+            async with aiofiles.open(self._index_file, "rb") as f:
+                content = await f.read()
+            return [
+                _CheckpointIndexEntry(**json.loads(line))
+                for line in content.splitlines()
+                if line.strip()
+            ]
+        except (OSError, ValueError, TypeError):
+            return None
 
     @property
     def history(self) -> Sequence[Message]:
@@ -57,21 +393,90 @@ class Context:
     def token_count(self) -> int:
         return self._token_count
 
+    @property
+    def pending_token_estimate(self) -> int:
+        """
+        Estimated tokens of the messages appended after the token count was last reported,
+        e.g. tool results which the provider has not seen yet.
+        """
+        n_tokens = 0
+        for index in range(self._n_counted_messages, len(self._history)):
+            if (estimate := self._token_estimates.get(index)) is None:
+                estimate = self._token_estimator.estimate(self._history[index])
+                self._token_estimates[index] = estimate
+            n_tokens += estimate
+        return n_tokens
+
     @property
     def n_checkpoints(self) -> int:
         return self._next_checkpoint_id
 
+    @property
+    def generation(self) -> int:
+        """
+        The history generation. Messages are only appended within a generation, so
+        `(generation, len(history))` can be used as a cursor for incremental syncing.
+        """
+        return self._generation
+
     async def checkpoint(self, add_user_message: bool):
         checkpoint_id = self._next_checkpoint_id
         self._next_checkpoint_id += 1
         logger.debug("Checkpointing, ID: {id}", id=checkpoint_id)
 
-        async with aiofiles.open(self._file_backend, "a", encoding="utf-8") as f:
-            await f.write(json.dumps({"role": "_checkpoint", "id": checkpoint_id}) + "\n")
+        offset = self._writer.append(
+            json.dumps({"role": "_checkpoint", "id": checkpoint_id}).encode("utf-8"), boundary=True
+        )
+        entry = _CheckpointIndexEntry(
+            id=checkpoint_id,
+            offset=offset,
+            n_messages=len(self._history),
+            token_count=self._token_count,
+            n_counted_messages=self._n_counted_messages,
+        )
+        self._checkpoints.append(entry)
+        self._index_writer.write(_encode_index_entry(entry))
         if add_user_message:
             await self.append_message(
                 Message(role="user", content=[system(f"CHECKPOINT {checkpoint_id}")])
             )
+        if self._storage.fsync_on_checkpoint:
+            await self.flush(fsync=True)
+        elif self._storage.flush_policy == "step":
+            await self.flush()
+
+    async def flush(self, *, fsync: bool = False) -> None:
+        """Write all buffered records to the file backend."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        await self._writer.flush(fsync=fsync)
+        await self._index_writer.flush()
+        interval = self._storage.snapshot_interval_bytes
+        if interval > 0 and self._writer.offset - self._snapshot_offset >= max(
+            interval, _SNAPSHOT_GROWTH * self._snapshot_bytes
+        ):
+            await self._write_snapshot()
+
+    async def close(self) -> None:
+        """Flush buffered records and release the file backend."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        await self._writer.close()
+        await self._index_writer.close()
+
+    def _schedule_flush(self) -> None:
+        if self._storage.flush_policy != "interval" or self._flush_timer is not None:
+            return
+
+        def _on_timer() -> None:
+            self._flush_timer = None
+            self._flush_task = asyncio.create_task(self.flush())
+
+        self._flush_timer = asyncio.get_running_loop().call_later(
+            self._storage.flush_interval_ms / 1000, _on_timer
+        )
 
     async def revert_to(self, checkpoint_id: int):
         """
@@ -79,6 +484,9 @@ class Context:
         After this, the specified checkpoint and all subsequent content will be
         removed from the context. File backend will be rotated.
 
+        The checkpoint index tells where the checkpoint is in the file and what the
+        context looked like before it, so no message is re-parsed.
+
         Args:
             checkpoint_id (int): The ID of the checkpoint to revert to. 0 is the first checkpoint.
 
@@ -92,53 +500,72 @@ class Context:
             logger.error("Checkpoint {checkpoint_id} does not exist", checkpoint_id=checkpoint_id)
             raise ValueError(f"Checkpoint {checkpoint_id} does not exist")
 
-        # rotate the history file
+        # the file is about to be replaced, so write out and release the current handles
+        await self.close()
+        entry = self._checkpoints[checkpoint_id]
+        async with self._snapshot_lock:
+            if entry.base_level is not None or self._snapshot_offset > entry.offset:
+                # the snapshot covers content which is being reverted
+                await self._discard_snapshot()
+
+        # rotate the history file, and copy back the part before the checkpoint
         rotated_file_path = await next_available_rotation(self._file_backend)
         if rotated_file_path is None:
             logger.error("No available rotation path found")
             raise RuntimeError("No available rotation path found")
-        await aiofiles.os.replace(self._file_backend, rotated_file_path)
-        logger.debug(
-            "Rotated history file: {rotated_file_path}", rotated_file_path=rotated_file_path
-        )
+        if entry.base_level is None:
+            await aiofiles.os.replace(self._file_backend, rotated_file_path)
+            logger.debug(
+                "Rotated history file: {rotated_file_path}", rotated_file_path=rotated_file_path
+            )
+            await asyncio.to_thread(
+                _copy_file_prefix, rotated_file_path, self._file_backend, entry.offset
+            )
+        elif await aiofiles.os.path.exists(self._file_backend):
+            # the checkpoint is in a base file, so nothing of the own file is kept
+            await aiofiles.os.replace(self._file_backend, rotated_file_path)
+            logger.debug(
+                "Rotated history file: {rotated_file_path}", rotated_file_path=rotated_file_path
+            )
 
         # restore the context until the specified checkpoint
-        self._history.clear()
-        self._token_count = 0
-        self._next_checkpoint_id = 0
-        async with (
-            aiofiles.open(rotated_file_path, encoding="utf-8") as old_file,
-            aiofiles.open(self._file_backend, "w", encoding="utf-8") as new_file,
-        ):
-            async for line in old_file:
-                if not line.strip():
-                    continue
-
-                line_json = json.loads(line)
-                if line_json["role"] == "_checkpoint" and line_json["id"] == checkpoint_id:
-                    break
-
-                await new_file.write(line)
-                if line_json["role"] == "_usage":
-                    self._token_count = line_json["token_count"]
-                elif line_json["role"] == "_checkpoint":
-                    self._next_checkpoint_id = line_json["id"] + 1
-                else:
-                    message = Message.model_validate(line_json)
-                    self._history.append(message)
+        self._generation += 1
+        del self._history[entry.n_messages :]
+        self._token_count = entry.token_count
+        self._n_counted_messages = entry.n_counted_messages
+        self._token_estimates = {
+            index: estimate
+            for index, estimate in self._token_estimates.items()
+            if index < entry.n_messages
+        }
+        self._next_checkpoint_id = checkpoint_id
+        del self._checkpoints[checkpoint_id:]
+        self._writer = open_history_writer(self._file_backend, self._storage.format)
+        if entry.base_level is not None:
+            fork_record = {"role": "_fork", "level": entry.base_level, "offset": entry.offset}
+            self._writer.append(json.dumps(fork_record).encode("utf-8"))
+            await self._writer.flush()
+        self._index_writer = BufferedWriter(self._index_file, truncate=True)
+        for kept in self._checkpoints:
+            self._index_writer.write(_encode_index_entry(kept))
+        await self._index_writer.flush()
 
     async def append_message(self, message: Message | Sequence[Message]):
         logger.debug("Appending message(s) to context: {message}", message=message)
         messages = message if isinstance(message, Sequence) else [message]
         self._history.extend(messages)
 
-        async with aiofiles.open(self._file_backend, "a", encoding="utf-8") as f:
-            for message in messages:
-                await f.write(message.model_dump_json(exclude_none=True) + "\n")
+        for message in messages:
+            self._writer.append(message.model_dump_json(exclude_none=True).encode("utf-8"))
+        self._schedule_flush()
 
     async def update_token_count(self, token_count: int):
         logger.debug("Updating token count in context: {token_count}", token_count=token_count)
         self._token_count = token_count
+        self._n_counted_messages = len(self._history)
+        self._token_estimates.clear()
 
-        async with aiofiles.open(self._file_backend, "a", encoding="utf-8") as f:
-            await f.write(json.dumps({"role": "_usage", "token_count": token_count}) + "\n")
+        self._writer.append(
+            json.dumps({"role": "_usage", "token_count": token_count}).encode("utf-8")
+        )
+        self._schedule_flush()
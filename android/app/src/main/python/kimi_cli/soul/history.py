@@ -0,0 +1,273 @@
+"""
+Storage formats of context history files.
+
+A history file is a sequence of JSON records (messages, `_usage` and `_checkpoint`), stored
+either as JSON lines, or in a compact binary format:
+
+    header: MAGIC
+    block:  codec (1 byte) | raw length (u32) | payload length (u32) | payload
+
+The raw payload of a block is a sequence of `length (u32) | record` entries, compressed as
+a whole with the block codec. Every flush writes one block, and a `_checkpoint` record always
+starts a new one, so checkpoint offsets can be used to truncate the file in both formats.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import os
+import struct
+import zlib
+from collections.abc import AsyncIterator, Iterator
+from pathlib import Path
+from typing import Literal
+
+import aiofiles
+
+from kimi_cli.utils.logging import logger
+
+try:
+    from compression import zstd  # pyright: ignore[reportMissingImports]
+except ImportError:
+    zstd = None
+
+type HistoryFormat = Literal["jsonl", "binary"]
+
+MAGIC = b"KIMIHIS\x01"
+
+_CODEC_NONE = 0
+_CODEC_ZLIB = 1
+_CODEC_ZSTD = 2
+_CODEC_ZLIB_DICT = 3
+_ZLIB_DICT = (
+    b'{"role": "_usage", "token_count": {"role": "_checkpoint", "id": '
+    b'{"role":"tool","content":[{"type":"text","text":"<system>'
+    b'</system>"}],"tool_call_id":"'
+    b'{"type":"image_url","image_url":{"url":"data:image/png;base64,'
+    b'{"role":"user","content":[{"type":"text","text":"'
+    b'{"role":"assistant","content":[{"type":"think","think":"","encrypted":null},'
+    b'{"type":"text","text":"'
+    b'"}],"tool_calls":[{"type":"function","id":"'
+    b'","function":{"name":"'
+    b'","arguments":"{\\"path\\": \\"'
+)
+"""
+Preset dictionary for small blocks, made of the boilerplate of serialized records. It is
+part of the file format and must never change; add a new codec for a new dictionary.
+"""
+_BLOCK_HEADER = struct.Struct("<BII")
+_RECORD_LENGTH = struct.Struct("<I")
+_MIN_COMPRESS_BYTES = 64
+"""Blocks smaller than this are stored uncompressed."""
+
+
+def compress(data: bytes) -> tuple[int, bytes]:
+    """Compress data with the best available codec, returning the codec and the payload."""
+    if len(data) < _MIN_COMPRESS_BYTES:
+        return _CODEC_NONE, data
+    if zstd is not None:
+        return _CODEC_ZSTD, zstd.compress(data)
+    compressor = zlib.compressobj(6, zdict=_ZLIB_DICT)
+    return _CODEC_ZLIB_DICT, compressor.compress(data) + compressor.flush()
+
+
+def decompress(codec: int, payload: bytes) -> bytes:
+    if codec == _CODEC_NONE:
+        return payload
+    try:
+        if codec == _CODEC_ZLIB:
+            return zlib.decompress(payload)
+        if codec == _CODEC_ZLIB_DICT:
+            decompressor = zlib.decompressobj(zdict=_ZLIB_DICT)
+            return decompressor.decompress(payload) + decompressor.flush()
+        if codec == _CODEC_ZSTD and zstd is not None:
+            return zstd.decompress(payload)
+    except Exception as e:
+        raise ValueError(f"Failed to decompress history block: {e}") from e
+    raise ValueError(f"Unsupported history block codec: {codec}")
+
+
+def detect_history_format(path: Path) -> HistoryFormat | None:
+    """Detect the format of a history file, or `None` if it is missing or empty."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(len(MAGIC))
+    except FileNotFoundError:
+        return None
+    if not head:
+        return None
+    return "binary" if head == MAGIC else "jsonl"
+
+
+class BufferedWriter:
+    """
+    Buffered append-only writer of a file.
+
+    Data is kept in memory until `flush`, which writes all of it with a single write call
+    through a file handle that stays open between flushes.
+    """
+
+    def __init__(self, path: Path, *, truncate: bool = False):
+        self._path = path
+        self._truncate = truncate
+        """Whether to discard the existing file content when it is first opened."""
+        self._buffer: list[bytes] = []
+        self._file: io.FileIO | None = None
+        self._lock = asyncio.Lock()
+        self._offset = 0 if truncate or not path.exists() else path.stat().st_size
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._buffer)
+
+    @property
+    def offset(self) -> int:
+        """The byte offset at which the next data will be written."""
+        return self._offset
+
+    def write(self, data: bytes) -> int:
+        """Buffer data and return its byte offset in the file."""
+        offset = self._offset
+        self._buffer.append(data)
+        self._offset += len(data)
+        return offset
+
+    async def flush(self, *, fsync: bool = False) -> None:
+        async with self._lock:
+            if not self._buffer and not self._truncate and not (fsync and self._file is not None):
+                return
+            data = b"".join(self._buffer)
+            self._buffer.clear()
+            await asyncio.to_thread(self._write, data, fsync)
+
+    async def close(self) -> None:
+        await self.flush()
+        async with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, data: bytes, fsync: bool) -> None:
+        if self._file is None:
+            self._file = io.FileIO(self._path, "w" if self._truncate else "a")
+            self._truncate = False
+        view = memoryview(data)
+        while view:
+            view = view[self._file.write(view) or 0 :]
+        if fsync:
+            os.fsync(self._file.fileno())
+
+
+class HistoryWriter(BufferedWriter):
+    """Buffered writer of history records, stored as JSON lines."""
+
+    def append(self, record: bytes, *, boundary: bool = False) -> int:
+        """
+        Buffer a record and return its byte offset in the file.
+
+        Args:
+            record (bytes): The JSON encoded record.
+            boundary (bool): Whether the record must be addressable by its offset, so that
+                the file can be truncated right before it.
+        """
+        return self.write(record + b"\n")
+
+
+class BinaryHistoryWriter(HistoryWriter):
+    """Buffered writer of history records, stored in compressed length-prefixed blocks."""
+
+    def __init__(self, path: Path, *, truncate: bool = False):
+        super().__init__(path, truncate=truncate)
+        self._records: list[bytes] = []
+        if self._offset == 0:
+            self.write(MAGIC)
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._records) or super().pending
+
+    def append(self, record: bytes, *, boundary: bool = False) -> int:
+        if boundary:
+            self._seal()
+        self._records.append(record)
+        # records are written in the block starting at the current offset
+        return self._offset
+
+    async def flush(self, *, fsync: bool = False) -> None:
+        self._seal()
+        await super().flush(fsync=fsync)
+
+    def _seal(self) -> None:
+        if not self._records:
+            return
+        raw = b"".join(_RECORD_LENGTH.pack(len(record)) + record for record in self._records)
+        self._records.clear()
+        codec, payload = compress(raw)
+        self.write(_BLOCK_HEADER.pack(codec, len(raw), len(payload)) + payload)
+
+
+def open_history_writer(
+    path: Path, format: HistoryFormat, *, truncate: bool = False
+) -> HistoryWriter:
+    if format == "binary":
+        return BinaryHistoryWriter(path, truncate=truncate)
+    return HistoryWriter(path, truncate=truncate)
+
+
+async def read_history_records(path: Path, offset: int = 0) -> AsyncIterator[tuple[int, bytes]]:
+    """
+    Read the JSON records of a history file in any format, starting from a byte offset.
+
+    Yields:
+        tuple[int, bytes]: The byte offset of the record (of its block for binary files)
+            and the JSON encoded record.
+    """
+    if detect_history_format(path) == "binary":
+        async with aiofiles.open(path, "rb") as f:
+            await f.seek(max(offset, len(MAGIC)))
+            data = await f.read()
+        offset = max(offset, len(MAGIC))
+        for block_offset, raw in _iter_blocks(data, offset, path):
+            pos = 0
+            while pos < len(raw):
+                (length,) = _RECORD_LENGTH.unpack_from(raw, pos)
+                pos += _RECORD_LENGTH.size
+                yield block_offset, raw[pos : pos + length]
+                pos += length
+        return
+
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(offset)
+        async for line in f:
+            line_offset = offset
+            offset += len(line)
+            if record := line.rstrip():
+                yield line_offset, record
+
+
+def _iter_blocks(data: bytes, offset: int, path: Path) -> Iterator[tuple[int, bytes]]:
+    pos = 0
+    while pos < len(data):
+        if pos + _BLOCK_HEADER.size > len(data):
+            logger.warning("Truncated block at the end of history file: {path}", path=path)
+            return
+        codec, raw_length, payload_length = _BLOCK_HEADER.unpack_from(data, pos)
+        start = pos + _BLOCK_HEADER.size
+        if start + payload_length > len(data):
+            logger.warning("Truncated block at the end of history file: {path}", path=path)
+            return
+        raw = decompress(codec, data[start : start + payload_length])
+        if len(raw) != raw_length:
+            raise ValueError(f"Corrupted block at offset {offset + pos} of {path}")
+        yield offset + pos, raw
+        pos = start + payload_length
+
+
+async def convert_history(src: Path, dst: Path, format: HistoryFormat) -> None:
+    """Convert a history file in any format to the given format, overwriting `dst`."""
+    writer = open_history_writer(dst, format, truncate=True)
+    async for _, record in read_history_records(src):
+        writer.append(record, boundary=json.loads(record)["role"] == "_checkpoint")
+    await writer.close()
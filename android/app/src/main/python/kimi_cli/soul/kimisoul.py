@@ -1,7 +1,11 @@
 from __future__ import annotations
 
 import asyncio
+import math
+import time
 from collections.abc import Sequence
+from contextlib import AbstractAsyncContextManager, nullcontext
+from dataclasses import dataclass
 from functools import partial
 from typing import TYPE_CHECKING
 
@@ -14,6 +18,7 @@ from kosong.chat_provider import (
     APIStatusError,
     APITimeoutError,
     ChatProviderError,
+    StreamedMessagePart,
     ThinkingEffort,
 )
 from kosong.message import ContentPart, Message
@@ -30,10 +35,24 @@ from kimi_cli.soul import (
     wire_send,
 )
 from kimi_cli.soul.agent import Agent
-from kimi_cli.soul.compaction import SimpleCompaction
+from kimi_cli.soul.compaction import (
+    ChunkedCompaction,
+    Compaction,
+    PruningCompaction,
+    RollingCompaction,
+    SimpleCompaction,
+)
 from kimi_cli.soul.context import Context
-from kimi_cli.soul.message import check_message, system, tool_result_to_message
+from kimi_cli.soul.metrics import AttributeValue, StepMetricsRecorder
+from kimi_cli.soul.message import (
+    check_message,
+    is_checkpoint_message,
+    system,
+    tool_result_to_message,
+)
 from kimi_cli.soul.runtime import Runtime
+from kimi_cli.soul.tokens import calibrate, calibration_factor
+from kimi_cli.soul.toolset import CustomToolset
 from kimi_cli.tools.dmail import NAME as SendDMail_NAME
 from kimi_cli.tools.utils import ToolRejectedError
 from kimi_cli.utils.logging import logger
@@ -54,6 +73,15 @@ if TYPE_CHECKING:
 RESERVED_TOKENS = 50_000
 
 
+@dataclass(slots=True)
+class _Precompaction:
+    """A compaction running in the background, of the first messages of a history generation."""
+
+    generation: int
+    n_messages: int
+    task: asyncio.Task[Sequence[Message] | None]
+
+
 class KimiSoul(Soul):
     """The soul of Kimi CLI."""
 
@@ -78,8 +106,19 @@ class KimiSoul(Soul):
         self._approval = runtime.approval
         self._context = context
         self._loop_control = runtime.config.loop_control
-        self._compaction = SimpleCompaction()  # TODO: maybe configurable and composable
+        self._compaction: Compaction
+        match self._loop_control.compaction:
+            case "rolling":
+                self._compaction = RollingCompaction()
+            case "simple":
+                self._compaction = SimpleCompaction()
+            case "pruning":
+                self._compaction = PruningCompaction(fallback=SimpleCompaction())
+            case "chunked":
+                self._compaction = ChunkedCompaction()
         self._reserved_tokens = RESERVED_TOKENS
+        self._precompaction: _Precompaction | None = None
+        self._cache_hit_rate: float | None = None
         if self._runtime.llm is not None:
             assert self._reserved_tokens <= self._runtime.llm.max_context_size
         self._thinking_effort: ThinkingEffort = "off"
@@ -107,7 +146,13 @@ class KimiSoul(Soul):
 
     @property
     def status(self) -> StatusSnapshot:
-        return StatusSnapshot(context_usage=self._context_usage)
+        return StatusSnapshot(
+            context_usage=self._context_usage, cache_hit_rate=self._cache_hit_rate
+        )
+
+    @property
+    def agent(self) -> Agent:
+        return self._agent
 
     @property
     def context(self) -> Context:
@@ -116,9 +161,21 @@ class KimiSoul(Soul):
     @property
     def _context_usage(self) -> float:
         if self._runtime.llm is not None:
-            return self._context.token_count / self._runtime.llm.max_context_size
+            return self._estimated_token_count / self._runtime.llm.max_context_size
         return 0.0
 
+    @property
+    def _estimated_token_count(self) -> int:
+        """
+        The token count last reported by the provider, plus the calibrated local estimate
+        of the messages appended since, such as tool results.
+        """
+        if not (pending := self._context.pending_token_estimate):
+            return self._context.token_count
+        return self._context.token_count + math.ceil(
+            pending * calibration_factor(self.model_name)
+        )
+
     @property
     def thinking(self) -> bool:
         """Whether thinking mode is enabled."""
@@ -152,7 +209,11 @@ class KimiSoul(Soul):
         await self._checkpoint()  # this creates the checkpoint 0 on first run
         await self._context.append_message(user_message)
         logger.debug("Appended user message to context")
-        await self._agent_loop()
+        try:
+            await self._agent_loop()
+        finally:
+            # records of the last step are still buffered
+            await asyncio.shield(self._context.flush())
 
     async def _agent_loop(self):
         """The main agent loop for one run."""
@@ -171,22 +232,19 @@ class KimiSoul(Soul):
             # from the main agent. We must ensure that the Task tool will redirect them
             # to the main wire. See `_SubWire` for more details. Later we need to figure
             # out a better solution.
+            metrics = StepMetricsRecorder(step_no)
             try:
                 # compact the context if needed
-                if (
-                    self._context.token_count + self._reserved_tokens
-                    >= self._runtime.llm.max_context_size
-                ):
-                    logger.info("Context too long, compacting...")
-                    wire_send(CompactionBegin())
-                    await self.compact_context()
-                    wire_send(CompactionEnd())
+                await self._compact_if_needed(metrics)
 
                 logger.debug("Beginning step {step_no}", step_no=step_no)
-                await self._checkpoint()
+                with metrics.span("checkpoint"):
+                    await self._checkpoint()
                 self._denwa_renji.set_n_checkpoints(self._context.n_checkpoints)
-                finished = await self._step()
+                finished = await self._step(metrics)
+                wire_send(metrics.finish())
             except BackToTheFuture as e:
+                wire_send(metrics.finish())
                 await self._context.revert_to(e.checkpoint_id)
                 await self._checkpoint()
                 await self._context.append_message(e.messages)
@@ -205,11 +263,27 @@ class KimiSoul(Soul):
             if step_no > self._loop_control.max_steps_per_run:
                 raise MaxStepsReached(self._loop_control.max_steps_per_run)
 
-    async def _step(self) -> bool:
+    async def _step(self, metrics: StepMetricsRecorder) -> bool:
         """Run an single step and return whether the run should be stopped."""
         # already checked in `run`
         assert self._runtime.llm is not None
         chat_provider = self._runtime.llm.chat_provider
+        history = self._context.history
+        if self._agent.environment is not None:
+            # sent last, so that the system prompt and the history stay a cacheable prefix
+            history = [*history, Message(role="user", content=[system(self._agent.environment)])]
+        estimated_tokens = self._context.token_count + self._context.pending_token_estimate
+        n_attempts = 0
+        attempt_started_at = 0.0
+        first_part_at: float | None = None
+        last_part_at: float | None = None
+
+        def _on_message_part(part: StreamedMessagePart) -> None:
+            nonlocal first_part_at, last_part_at
+            last_part_at = time.monotonic()
+            if first_part_at is None:
+                first_part_at = last_part_at
+            wire_send(part)
 
         @tenacity.retry(
             retry=retry_if_exception(self._is_retryable_error),
@@ -219,29 +293,71 @@ class KimiSoul(Soul):
             reraise=True,
         )
         async def _kosong_step_with_retry() -> StepResult:
-            # run an LLM step (may be interrupted)
-            return await kosong.step(
-                chat_provider.with_thinking(self._thinking_effort),
-                self._agent.system_prompt,
-                self._agent.toolset,
-                self._context.history,
-                on_message_part=wire_send,
-                on_tool_result=wire_send,
-            )
+            nonlocal n_attempts, attempt_started_at, first_part_at, last_part_at
+            n_attempts += 1
+            attempt_started_at = time.monotonic()
+            first_part_at = last_part_at = None
+            try:
+                async with self._rate_limited(estimated_tokens):
+                    # run an LLM step (may be interrupted)
+                    return await kosong.step(
+                        chat_provider.with_thinking(self._thinking_effort),
+                        self._agent.system_prompt,
+                        self._agent.toolset,
+                        history,
+                        on_message_part=_on_message_part,
+                        on_tool_result=wire_send,
+                    )
+            except Exception as e:
+                metrics.add(
+                    "llm_attempt_failed",
+                    attempt_started_at,
+                    time.monotonic() - attempt_started_at,
+                    error=type(e).__name__,
+                )
+                raise
 
         result = await _kosong_step_with_retry()
         logger.debug("Got step result: {result}", result=result)
+        self._record_llm_spans(
+            metrics, result, n_attempts, attempt_started_at, first_part_at, last_part_at
+        )
         if result.usage is not None:
+            if (governor := self._runtime.llm.rate_governor) is not None:
+                governor.record_usage(result.usage.total, estimated_tokens)
+            if self._context.token_count > 0:
+                # the input grew by what the messages appended since the last report take
+                calibrate(
+                    self.model_name,
+                    self._context.pending_token_estimate,
+                    result.usage.input - self._context.token_count,
+                )
             # mark the token count for the context before the step
             await self._context.update_token_count(result.usage.input)
+            if result.usage.input > 0:
+                self._cache_hit_rate = result.usage.input_cache_read / result.usage.input
             wire_send(StatusUpdate(status=self.status))
 
         # wait for all tool results (may be interrupted)
         results = await result.tool_results()
         logger.debug("Got tool results: {results}", results=results)
+        if isinstance(self._agent.toolset, CustomToolset):
+            for timing in self._agent.toolset.pop_timings():
+                metrics.add(
+                    "tool_call",
+                    timing.started_at,
+                    timing.run_s,
+                    name=timing.name,
+                    tool_call_id=timing.tool_call_id,
+                    queued_s=timing.queued_s,
+                    cache_hit=timing.cache_hit,
+                )
 
         # shield the context manipulation from interruption
-        await asyncio.shield(self._grow_context(result, results))
+        with metrics.span("grow_context", n_messages=1 + len(results)):
+            await asyncio.shield(self._grow_context(result, results))
+        # tool results are only estimated until the next step reports the usage
+        wire_send(StatusUpdate(status=self.status))
 
         rejected = any(isinstance(result.result, ToolRejectedError) for result in results)
         if rejected:
@@ -276,6 +392,32 @@ class KimiSoul(Soul):
 
         return not result.tool_calls
 
+    @staticmethod
+    def _record_llm_spans(
+        metrics: StepMetricsRecorder,
+        result: StepResult,
+        n_attempts: int,
+        started_at: float,
+        first_part_at: float | None,
+        last_part_at: float | None,
+    ) -> None:
+        """Record the spans of the successful LLM request, from its start."""
+        attributes: dict[str, AttributeValue] = {"attempts": n_attempts}
+        if result.usage is not None:
+            attributes["input_tokens"] = result.usage.input
+            attributes["output_tokens"] = result.usage.output
+            attributes["input_cache_read_tokens"] = result.usage.input_cache_read
+        metrics.add("llm_request", started_at, time.monotonic() - started_at, **attributes)
+        if first_part_at is None or last_part_at is None:
+            return
+        metrics.add("first_token", started_at, first_part_at - started_at)
+        last_token_attributes: dict[str, AttributeValue] = {}
+        if result.usage is not None and last_part_at > first_part_at:
+            last_token_attributes["output_tokens_per_s"] = round(
+                result.usage.output / (last_part_at - first_part_at), 1
+            )
+        metrics.add("last_token", started_at, last_part_at - started_at, **last_token_attributes)
+
     async def _grow_context(self, result: StepResult, tool_results: list[ToolResult]):
         logger.debug("Growing context with result: {result}", result=result)
 
@@ -297,7 +439,106 @@ class KimiSoul(Soul):
             "Appending tool messages to context: {tool_messages}", tool_messages=tool_messages
         )
         await self._context.append_message(tool_messages)
-        # token count of tool results are not available yet
+        # token count of tool results are not available yet, they are estimated locally
+
+    @property
+    def _context_too_long(self) -> bool:
+        assert self._runtime.llm is not None
+        return (
+            self._estimated_token_count + self._reserved_tokens
+            >= self._runtime.llm.max_context_size
+        )
+
+    @property
+    def _precompaction_due(self) -> bool:
+        """
+        Whether the context reached the soft threshold. It is a share of the window left by the
+        reserved tokens, so that it is reached before the context is too long.
+        """
+        threshold = self._loop_control.precompaction_threshold
+        if threshold is None or self._runtime.llm is None:
+            return False
+        usable_tokens = self._runtime.llm.max_context_size - self._reserved_tokens
+        return self._estimated_token_count >= threshold * usable_tokens
+
+    async def _compact_if_needed(self, metrics: StepMetricsRecorder) -> None:
+        """
+        Compact the context when it is too long, preferably by swapping in the result of the
+        background compaction started once the context usage reached the soft threshold.
+        """
+        if self._context_too_long:
+            logger.info("Context too long, compacting...")
+            wire_send(CompactionBegin())
+            with metrics.span("compaction") as attributes:
+                attributes["background"] = await self._swap_in_precompaction()
+                attributes["blocking"] = not attributes["background"] or self._context_too_long
+                if attributes["blocking"]:
+                    await self.compact_context()
+            wire_send(CompactionEnd())
+            return
+
+        if (
+            self._precompaction is not None
+            and self._precompaction.generation != self._context.generation
+        ):
+            # the context was reverted, the background compaction is of no use any more
+            self._precompaction.task.cancel()
+            self._precompaction = None
+        if self._precompaction is None and self._precompaction_due:
+            self._start_precompaction()
+
+    def _start_precompaction(self) -> None:
+        # messages are only appended within a generation, so this prefix stays stable
+        history = list(self._context.history)
+        logger.info(
+            "Context usage reached {usage:.0%}, compacting in the background...",
+            usage=self._context_usage,
+        )
+
+        async def _precompact() -> Sequence[Message] | None:
+            try:
+                return await self._compact_with_retry(history)
+            except Exception as e:
+                logger.warning("Background compaction failed: {error}", error=e)
+                return None
+
+        self._precompaction = _Precompaction(
+            generation=self._context.generation,
+            n_messages=len(history),
+            task=asyncio.create_task(_precompact(), name="precompaction"),
+        )
+
+    async def _swap_in_precompaction(self) -> bool:
+        """
+        Replace the compacted prefix of the context with the result of the background
+        compaction, keeping the messages appended since. Returns whether it was swapped in.
+        """
+        precompaction, self._precompaction = self._precompaction, None
+        if precompaction is None:
+            return False
+        if precompaction.generation != self._context.generation:
+            precompaction.task.cancel()
+            return False
+        compacted_messages = await precompaction.task
+        if compacted_messages is None:
+            return False
+
+        appended_messages = self._context.history[precompaction.n_messages :]
+        logger.info(
+            "Swapping in background compaction, with {n} messages appended since",
+            n=len(appended_messages),
+        )
+        await self._context.revert_to(0)
+        await self._checkpoint()
+        await self._context.append_message(compacted_messages)
+        for message in appended_messages:
+            if is_checkpoint_message(message):
+                # the old checkpoints are gone, so they are created again with new IDs
+                await self._checkpoint()
+            else:
+                await self._context.append_message(message)
+        await self._context.flush()
+        return True
 
     async def compact_context(self) -> None:
         """
@@ -307,7 +548,16 @@ class KimiSoul(Soul):
             LLMNotSet: When the LLM is not set.
             ChatProviderError: When the chat provider returns an error.
         """
+        if self._precompaction is not None:
+            self._precompaction.task.cancel()
+            self._precompaction = None
+        compacted_messages = await self._compact_with_retry(self._context.history)
+        await self._context.revert_to(0)
+        await self._checkpoint()
+        await self._context.append_message(compacted_messages)
+        await self._context.flush()
 
+    async def _compact_with_retry(self, messages: Sequence[Message]) -> Sequence[Message]:
         @tenacity.retry(
             retry=retry_if_exception(self._is_retryable_error),
             before_sleep=partial(self._retry_log, "compaction"),
@@ -315,15 +565,20 @@ class KimiSoul(Soul):
             stop=stop_after_attempt(self._loop_control.max_retries_per_step),
             reraise=True,
         )
-        async def _compact_with_retry() -> Sequence[Message]:
+        async def _compact() -> Sequence[Message]:
             if self._runtime.llm is None:
                 raise LLMNotSet()
-            return await self._compaction.compact(self._context.history, self._runtime.llm)
+            async with self._rate_limited(self._context.token_count):
+                return await self._compaction.compact(messages, self._runtime.llm)
 
-        compacted_messages = await _compact_with_retry()
-        await self._context.revert_to(0)
-        await self._checkpoint()
-        await self._context.append_message(compacted_messages)
+        return await _compact()
+
+    def _rate_limited(self, n_tokens: int) -> AbstractAsyncContextManager[None]:
+        """Wait for the rate governor of the LLM, if any, to send a request."""
+        assert self._runtime.llm is not None
+        if (governor := self._runtime.llm.rate_governor) is None:
+            return nullcontext()
+        return governor.request(n_tokens)
 
     @staticmethod
     def _is_retryable_error(exception: BaseException) -> bool:
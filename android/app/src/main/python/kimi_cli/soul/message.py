@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import re
 from collections.abc import Sequence
 
 from kosong.message import ContentPart, ImageURLPart, Message, TextPart, ThinkPart
@@ -9,10 +10,21 @@ from kosong.tooling.error import ToolRuntimeError
 from kimi_cli.llm import ModelCapability
 
 
+_CHECKPOINT_PATTERN = re.compile(r"^<system>CHECKPOINT \d+</system>$")
+
+
 def system(message: str) -> ContentPart:
     return TextPart(text=f"<system>{message}</system>")
 
 
+def is_checkpoint_message(message: Message) -> bool:
+    """Whether the message is the user message added by `Context.checkpoint`."""
+    if message.role != "user" or isinstance(message.content, str) or not message.content:
+        return False
+    part = message.content[0]
+    return isinstance(part, TextPart) and bool(_CHECKPOINT_PATTERN.match(part.text))
+
+
 def tool_result_to_message(tool_result: ToolResult) -> Message:
     """Convert a tool result to a message."""
     if isinstance(tool_result.result, ToolError):
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from kimi_cli.wire.message import MetricSpan, StepMetrics
+
+type AttributeValue = str | int | float | bool
+
+
+class StepMetricsRecorder:
+    """Record the spans of an agent step, with times relative to the beginning of the step."""
+
+    def __init__(self, n: int):
+        self._n = n
+        self._started_at = time.monotonic()
+        self._spans: list[MetricSpan] = []
+
+    def add(
+        self,
+        name: str,
+        started_at: float,
+        duration_s: float,
+        **attributes: AttributeValue,
+    ) -> None:
+        """
+        Add a span which started at `started_at`, a `time.monotonic()` timestamp.
+        """
+        self._spans.append(
+            MetricSpan(
+                name=name,
+                start_s=started_at - self._started_at,
+                duration_s=duration_s,
+                attributes=attributes,
+            )
+        )
+
+    @contextmanager
+    def span(self, name: str, **attributes: AttributeValue) -> Iterator[dict[str, AttributeValue]]:
+        """
+        Record the time spent in the block as a span. Attributes can be added to the yielded
+        dict inside the block.
+        """
+        started_at = time.monotonic()
+        try:
+            yield attributes
+        finally:
+            self.add(name, started_at, time.monotonic() - started_at, **attributes)
+
+    def finish(self) -> StepMetrics:
+        return StepMetrics(
+            n=self._n,
+            duration_s=time.monotonic() - self._started_at,
+            spans=sorted(self._spans, key=lambda span: span.start_s),
+        )
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import math
+from typing import TYPE_CHECKING, Protocol, runtime_checkable
+
+from kosong.message import ImageURLPart, Message, TextPart, ThinkPart
+
+_MESSAGE_OVERHEAD_TOKENS = 4
+"""Tokens taken by the role and delimiters of a message."""
+_IMAGE_TOKENS = 1_000
+_ASCII_CHARS_PER_TOKEN = 4.0
+_NON_ASCII_TOKENS_PER_CHAR = 1.0
+"""CJK characters are mostly one token each; other non-ASCII text is rare."""
+
+_CALIBRATION_MIN_TOKENS = 200
+"""Estimates smaller than this are too noisy to learn a calibration from."""
+_CALIBRATION_SMOOTHING = 0.3
+_CALIBRATION_BOUNDS = (0.25, 4.0)
+
+
+@runtime_checkable
+class TokenEstimator(Protocol):
+    def estimate(self, message: Message) -> int:
+        """
+        Estimate the number of tokens a message takes in the model input, without
+        calling the model.
+        """
+        ...
+
+
+class HeuristicTokenEstimator(TokenEstimator):
+    """Estimate tokens from the number of ASCII and non-ASCII characters."""
+
+    def estimate(self, message: Message) -> int:
+        n_tokens = _MESSAGE_OVERHEAD_TOKENS
+        if isinstance(message.content, str):
+            n_tokens += self.estimate_text(message.content)
+        else:
+            for part in message.content:
+                if isinstance(part, TextPart):
+                    n_tokens += self.estimate_text(part.text)
+                elif isinstance(part, ThinkPart):
+                    n_tokens += self.estimate_text(part.think)
+                elif isinstance(part, ImageURLPart):
+                    n_tokens += _IMAGE_TOKENS
+        for tool_call in message.tool_calls or []:
+            n_tokens += _MESSAGE_OVERHEAD_TOKENS + self.estimate_text(tool_call.function.name)
+            n_tokens += self.estimate_text(tool_call.function.arguments or "")
+        return n_tokens
+
+    @staticmethod
+    def estimate_text(text: str) -> int:
+        n_ascii = len(text.encode("ascii", "ignore"))
+        n_non_ascii = len(text) - n_ascii
+        return math.ceil(
+            n_ascii / _ASCII_CHARS_PER_TOKEN + n_non_ascii * _NON_ASCII_TOKENS_PER_CHAR
+        )
+
+
+_calibration_factors: dict[str, float] = {}
+"""Learned ratios of reported to estimated tokens, by model name."""
+
+
+def calibration_factor(model_name: str) -> float:
+    return _calibration_factors.get(model_name, 1.0)
+
+
+def calibrate(model_name: str, estimated: int, reported: int) -> None:
+    """
+    Learn from the token count the provider reported for content whose estimate is known.
+    """
+    if estimated < _CALIBRATION_MIN_TOKENS or reported <= 0:
+        return
+    low, high = _CALIBRATION_BOUNDS
+    ratio = min(max(reported / estimated, low), high)
+    if (factor := _calibration_factors.get(model_name)) is None:
+        _calibration_factors[model_name] = ratio
+    else:
+        _calibration_factors[model_name] = factor + _CALIBRATION_SMOOTHING * (ratio - factor)
+
+
+if TYPE_CHECKING:
+
+    def type_check(heuristic: HeuristicTokenEstimator):
+        _: TokenEstimator = heuristic
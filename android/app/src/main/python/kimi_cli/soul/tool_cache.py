@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+
+from kosong.message import ToolCall
+from kosong.tooling import ToolOk
+
+from kimi_cli.utils.logging import logger
+
+_CACHEABLE_TOOLS = {"ReadFile", "Glob", "Grep"}
+_PATH_ARGUMENTS = ("path", "directory")
+_MAX_TRACKED_PATHS = 4096
+"""Searches over more paths than this are not cached, validating them costs too much."""
+
+type _Fingerprint = tuple[tuple[str, int, int], ...]
+"""The path, mtime and size of every file and directory a tool result depends on."""
+
+
+@dataclass(frozen=True, slots=True)
+class ToolCacheStats:
+    n_hits: int
+    n_misses: int
+    n_entries: int
+    n_bytes: int
+
+
+@dataclass(slots=True)
+class _Entry:
+    fingerprint: _Fingerprint
+    result: ToolOk
+    size: int
+
+
+class ToolResultCache:
+    """
+    LRU cache of the results of read-only tools, keyed by the tool name and the normalized
+    arguments.
+
+    An entry records the mtimes and sizes of the files and directories the result depends on,
+    and is only used while they are unchanged. Searches record every directory under their
+    root, so adding, removing or renaming a file anywhere in the tree invalidates them, and
+    Grep also records every file under its root, so modifying any of them invalidates it.
+
+    The cache is only accessed from the event loop thread, the files are checked in a worker
+    thread.
+    """
+
+    def __init__(self, work_dir: Path, *, max_bytes: int, max_entry_bytes: int):
+        self._work_dir = work_dir
+        self._max_bytes = max_bytes
+        self._max_entry_bytes = max_entry_bytes
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._n_bytes = 0
+        self._n_hits = 0
+        self._n_misses = 0
+
+    @property
+    def stats(self) -> ToolCacheStats:
+        return ToolCacheStats(
+            n_hits=self._n_hits,
+            n_misses=self._n_misses,
+            n_entries=len(self._entries),
+            n_bytes=self._n_bytes,
+        )
+
+    def key(self, tool_call: ToolCall) -> str | None:
+        """The cache key of a tool call, or `None` if its result cannot be cached."""
+        if tool_call.function.name not in _CACHEABLE_TOOLS:
+            return None
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(arguments, dict):
+            return None
+        for name in _PATH_ARGUMENTS:
+            if isinstance(value := arguments.get(name), str):
+                arguments[name] = str(self._resolve(value))
+        normalized = json.dumps(arguments, sort_keys=True, ensure_ascii=False)
+        return f"{tool_call.function.name}:{normalized}"
+
+    def fingerprint(self, tool_call: ToolCall) -> _Fingerprint | None:
+        """
+        Record the state of the files and directories the result of a tool call depends on,
+        or `None` if there are too many of them. Call it before the tool runs.
+        """
+        arguments = json.loads(tool_call.function.arguments or "{}")
+        match tool_call.function.name:
+            case "ReadFile":
+                paths = [self._resolve(arguments.get("path", ""))]
+            case "Glob":
+                paths = self._walk(self._resolve(arguments.get("directory") or "."))
+            case _:
+                root = self._resolve(arguments.get("path") or ".")
+                paths = self._walk(root, files=True) if root.is_dir() else [root]
+        if paths is None:
+            return None
+        return _stat(paths)
+
+    async def get(self, key: str) -> ToolOk | None:
+        """Get the cached result of a tool call if the files it depends on are unchanged."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            paths = [path for path, _, _ in entry.fingerprint]
+            unchanged = await asyncio.to_thread(_stat, paths) == entry.fingerprint
+            # the entry may have been replaced, evicted or cleared while checking the files
+            if self._entries.get(key) is entry:
+                if unchanged:
+                    self._entries.move_to_end(key)
+                    self._n_hits += 1
+                    return entry.result
+                self._evict(key)
+        self._n_misses += 1
+        return None
+
+    def put(self, key: str, fingerprint: _Fingerprint, result: ToolOk) -> None:
+        size = _result_size(result)
+        if size > self._max_entry_bytes or size > self._max_bytes:
+            return
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = _Entry(fingerprint=fingerprint, result=result, size=size)
+        self._n_bytes += size
+        while self._n_bytes > self._max_bytes:
+            self._evict(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        if self._entries:
+            logger.debug("Clearing {n} cached tool results", n=len(self._entries))
+        self._entries.clear()
+        self._n_bytes = 0
+
+    def _evict(self, key: str) -> None:
+        self._n_bytes -= self._entries.pop(key).size
+
+    def _resolve(self, path: str) -> Path:
+        return Path(os.path.normpath(self._work_dir / path))
+
+    @staticmethod
+    def _walk(root: Path, *, files: bool = False) -> list[Path] | None:
+        """The directories under `root`, and the files if `files` is set."""
+        paths: list[Path] = []
+        for dir_path, _, file_names in os.walk(root):
+            paths.append(Path(dir_path))
+            if files:
+                paths.extend(Path(dir_path, name) for name in file_names)
+            if len(paths) > _MAX_TRACKED_PATHS:
+                return None
+        return paths
+
+
+def _stat(paths: Sequence[Path | str]) -> _Fingerprint:
+    fingerprint: list[tuple[str, int, int]] = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            fingerprint.append((str(path), -1, -1))
+        else:
+            fingerprint.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+def _result_size(result: ToolOk) -> int:
+    size = len(result.message.encode()) + len(result.brief.encode())
+    match result.output:
+        case str(text):
+            size += len(text.encode())
+        case Sequence():
+            size += sum(len(part.model_dump_json()) for part in result.output)
+        case part:
+            size += len(part.model_dump_json())
+    return size
@@ -1,14 +1,36 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from collections.abc import Iterable
 from contextvars import ContextVar
-from typing import override
+from dataclasses import dataclass
+from typing import Any, override
 
 from kosong.message import ToolCall
-from kosong.tooling import HandleResult
+from kosong.tooling import CallableTool, CallableTool2, HandleResult, ToolOk, ToolResult
 from kosong.tooling.simple import SimpleToolset
 
+from kimi_cli.soul.tool_cache import ToolResultCache
+from kimi_cli.utils.logging import logger
+
 current_tool_call = ContextVar[ToolCall | None]("current_tool_call", default=None)
 
+_READ_ONLY_FILE_TOOLS = {"ReadFile"}
+"""Tools which only read the file at their `path` argument."""
+_READ_ONLY_SEARCH_TOOLS = {"Glob", "Grep"}
+"""Tools which may read any file."""
+_READ_ONLY_TOOLS = {"FetchURL", "SearchWeb", "Think"}
+"""Tools which do not touch any file."""
+_MUTATING_FILE_TOOLS = {"WriteFile", "StrReplaceFile", "PatchFile"}
+"""Tools which only modify the file at their `path` argument."""
+_CONCURRENT_TOOLS = {"Task"}
+"""Tools which may modify any file but run concurrently with each other, like subagents."""
+_MAX_TIMINGS = 1000
+
 
 def get_current_tool_call_or_none() -> ToolCall | None:
     """
@@ -18,11 +40,188 @@ def get_current_tool_call_or_none() -> ToolCall | None:
     return current_tool_call.get()
 
 
+@dataclass(frozen=True, slots=True)
+class ToolCallTiming:
+    tool_call_id: str
+    name: str
+    started_at: float
+    """The `time.monotonic()` timestamp when the tool call started running."""
+    queued_s: float
+    """Time spent waiting for conflicting tool calls and for a free slot."""
+    run_s: float
+    cache_hit: bool = False
+
+
+@dataclass(frozen=True, slots=True)
+class _ToolEffect:
+    mutating: bool
+    paths: frozenset[str] | None
+    """The files the tool call touches, `None` for any file."""
+    group: str | None = None
+    """Tool calls in the same group never conflict with each other."""
+
+    def conflicts_with(self, other: _ToolEffect) -> bool:
+        if not self.mutating and not other.mutating:
+            return False
+        if self.group is not None and self.group == other.group:
+            return False
+        if self.paths is None:
+            return other.paths is None or bool(other.paths)
+        if other.paths is None:
+            return bool(self.paths)
+        return not self.paths.isdisjoint(other.paths)
+
+
+def _tool_effect(tool_call: ToolCall) -> _ToolEffect:
+    """
+    Classify a tool call by what it touches. Unknown tools, including Bash and MCP tools,
+    are assumed to modify anything.
+    """
+    name = tool_call.function.name
+    if name in _CONCURRENT_TOOLS:
+        return _ToolEffect(mutating=True, paths=None, group=name)
+    if name in _READ_ONLY_TOOLS:
+        return _ToolEffect(mutating=False, paths=frozenset())
+    if name in _READ_ONLY_SEARCH_TOOLS:
+        return _ToolEffect(mutating=False, paths=None)
+    if name in _READ_ONLY_FILE_TOOLS or name in _MUTATING_FILE_TOOLS:
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError:
+            arguments = None
+        path = arguments.get("path") if isinstance(arguments, dict) else None
+        return _ToolEffect(
+            mutating=name in _MUTATING_FILE_TOOLS,
+            paths=frozenset([os.path.normpath(path)]) if isinstance(path, str) else None,
+        )
+    return _ToolEffect(mutating=True, paths=None)
+
+
 class CustomToolset(SimpleToolset):
+    """
+    Toolset which schedules concurrent tool calls by their effects.
+
+    Tool calls are started in the order they are handled. A tool call waits for every earlier
+    tool call it conflicts with: read-only calls never conflict with each other, file edits
+    conflict with the other calls on the same path, subagent tasks conflict with everything
+    but each other, and Bash and unknown tools conflict with everything. At most
+    `max_concurrency` tool calls run at the same time.
+
+    Results of read-only tools are served from the cache when the files they depend on are
+    unchanged, and the cache is cleared whenever a tool call which may modify files runs.
+    """
+
+    def __init__(
+        self,
+        tools: Iterable[CallableTool | CallableTool2[Any]] | None = None,
+        *,
+        max_concurrency: int | None = None,
+        cache: ToolResultCache | None = None,
+    ):
+        super().__init__(tools)
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._cache = cache
+        self._in_flight: dict[asyncio.Task[ToolResult], _ToolEffect] = {}
+        self._timings = deque[ToolCallTiming](maxlen=_MAX_TIMINGS)
+
+    def find(self, name: str) -> CallableTool | CallableTool2[Any] | None:
+        """Find a loaded tool by its name."""
+        return self._tool_dict.get(name)
+
+    @property
+    def cache(self) -> ToolResultCache | None:
+        return self._cache
+
+    async def close(self) -> None:
+        """Close the tools which hold connections, such as MCP tools."""
+        for tool in self._tool_dict.values():
+            if (close := getattr(tool, "close", None)) is None:
+                continue
+            try:
+                await close()
+            except Exception as e:
+                logger.warning("Failed to close tool {name}: {error}", name=tool.name, error=e)
+
+    def pop_timings(self) -> list[ToolCallTiming]:
+        """Return the timings of the tool calls finished since the last call, and clear them."""
+        timings = list(self._timings)
+        self._timings.clear()
+        return timings
+
     @override
     def handle(self, tool_call: ToolCall) -> HandleResult:
+        if tool_call.function.name not in self._tool_dict:
+            return super().handle(tool_call)
+
+        effect = _tool_effect(tool_call)
+        conflicts = [
+            task for task, other in self._in_flight.items() if effect.conflicts_with(other)
+        ]
+        handled_at = time.monotonic()
+
+        cache = self._cache
+        cache_key = cache.key(tool_call) if cache is not None else None
+
+        started_at = handled_at
+
+        async def _run() -> ToolResult:
+            nonlocal started_at
+            if self._semaphore is not None:
+                await self._semaphore.acquire()
+            started_at = time.monotonic()
+            try:
+                if cache is not None and effect.mutating:
+                    cache.clear()
+                result = super(CustomToolset, self).handle(tool_call)
+                if not isinstance(result, ToolResult):
+                    result = await result
+                return result
+            finally:
+                if cache is not None and effect.mutating:
+                    cache.clear()
+                if self._semaphore is not None:
+                    self._semaphore.release()
+
+        async def _scheduled_call() -> ToolResult:
+            nonlocal started_at
+            if conflicts:
+                await asyncio.wait(conflicts)
+            cache_hit = False
+            if cache is None or cache_key is None:
+                result = await _run()
+            elif (cached := await cache.get(cache_key)) is not None:
+                started_at = time.monotonic()
+                result = ToolResult(tool_call.id, cached)
+                cache_hit = True
+            else:
+                fingerprint = await asyncio.to_thread(cache.fingerprint, tool_call)
+                result = await _run()
+                if fingerprint is not None and isinstance(result.result, ToolOk):
+                    cache.put(cache_key, fingerprint, result.result)
+            timing = ToolCallTiming(
+                tool_call_id=tool_call.id,
+                name=tool_call.function.name,
+                started_at=started_at,
+                queued_s=started_at - handled_at,
+                run_s=time.monotonic() - started_at,
+                cache_hit=cache_hit,
+            )
+            self._timings.append(timing)
+            logger.debug(
+                "Tool call {name} ({id}) queued {queued_s:.3f}s, ran {run_s:.3f}s{cached}",
+                name=timing.name,
+                id=timing.tool_call_id,
+                queued_s=timing.queued_s,
+                run_s=timing.run_s,
+                cached=" (cached)" if cache_hit else "",
+            )
+            return result
+
         token = current_tool_call.set(tool_call)
         try:
-            return super().handle(tool_call)
+            task = asyncio.create_task(_scheduled_call())
         finally:
             current_tool_call.reset(token)
+        self._in_flight[task] = effect
+        task.add_done_callback(self._in_flight.pop)
+        return task
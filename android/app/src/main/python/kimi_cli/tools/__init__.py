@@ -1,12 +1,16 @@
+from __future__ import annotations
+
 import json
 from pathlib import Path
-from typing import cast
+from typing import TYPE_CHECKING, cast
 
-import streamingjson  # pyright: ignore[reportMissingTypeStubs]
 from kosong.utils.typing import JsonType
 
 from kimi_cli.utils.string import shorten_middle
 
+if TYPE_CHECKING:
+    import streamingjson  # pyright: ignore[reportMissingTypeStubs]
+
 
 class SkipThisTool(Exception):
     """Raised when a tool decides to skip itself from the loading process."""
@@ -15,6 +19,9 @@ class SkipThisTool(Exception):
 
 
 def extract_key_argument(json_content: str | streamingjson.Lexer, tool_name: str) -> str | None:
+    # only used by UIs, so the streaming JSON lexer is imported lazily
+    import streamingjson  # pyright: ignore[reportMissingTypeStubs]
+
     if isinstance(json_content, streamingjson.Lexer):
         json_str = json_content.complete_json()
     else:
@@ -16,7 +16,7 @@ from pydantic import BaseModel, Field
 import kimi_cli
 from kimi_cli.share import get_share_dir
 from kimi_cli.tools.utils import load_desc
-from kimi_cli.utils.aiohttp import new_client_session
+from kimi_cli.utils.aiohttp import get_client_session
 from kimi_cli.utils.logging import logger
 
 
@@ -173,46 +173,46 @@ async def _download_and_install_rg(bin_name: str) -> Path:
     share_bin_dir.mkdir(parents=True, exist_ok=True)
     destination = share_bin_dir / bin_name
 
-    async with new_client_session() as session:
-        with tempfile.TemporaryDirectory(prefix="kimi-rg-") as tmpdir:
-            tar_path = Path(tmpdir) / filename
-
-            try:
-                async with session.get(url) as resp:
-                    resp.raise_for_status()
-                    with open(tar_path, "wb") as fh:
-                        async for chunk in resp.content.iter_chunked(1024 * 64):
-                            if chunk:
-                                fh.write(chunk)
-            except (aiohttp.ClientError, TimeoutError) as exc:
-                raise RuntimeError("Failed to download ripgrep binary") from exc
-
-            try:
-                if is_windows:
-                    with zipfile.ZipFile(tar_path, "r") as zf:
-                        member_name = next(
-                            (name for name in zf.namelist() if Path(name).name == bin_name),
-                            None,
-                        )
-                        if not member_name:
-                            raise RuntimeError("Ripgrep binary not found in archive")
-                        with zf.open(member_name) as source, open(destination, "wb") as dest_fh:
-                            shutil.copyfileobj(source, dest_fh)
-                else:
-                    with tarfile.open(tar_path, "r:gz") as tar:
-                        member = next(
-                            (m for m in tar.getmembers() if Path(m.name).name == bin_name),
-                            None,
-                        )
-                        if not member:
-                            raise RuntimeError("Ripgrep binary not found in archive")
-                        extracted = tar.extractfile(member)
-                        if not extracted:
-                            raise RuntimeError("Failed to extract ripgrep binary")
-                        with open(destination, "wb") as dest_fh:
-                            shutil.copyfileobj(extracted, dest_fh)
-            except (zipfile.BadZipFile, tarfile.TarError, OSError) as exc:
-                raise RuntimeError("Failed to extract ripgrep archive") from exc
+    session = get_client_session()
+    with tempfile.TemporaryDirectory(prefix="kimi-rg-") as tmpdir:
+        tar_path = Path(tmpdir) / filename
+
+        try:
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                with open(tar_path, "wb") as fh:
+                    async for chunk in resp.content.iter_chunked(1024 * 64):
+                        if chunk:
+                            fh.write(chunk)
+        except (aiohttp.ClientError, TimeoutError) as exc:
+            raise RuntimeError("Failed to download ripgrep binary") from exc
+
+        try:
+            if is_windows:
+                with zipfile.ZipFile(tar_path, "r") as zf:
+                    member_name = next(
+                        (name for name in zf.namelist() if Path(name).name == bin_name),
+                        None,
+                    )
+                    if not member_name:
+                        raise RuntimeError("Ripgrep binary not found in archive")
+                    with zf.open(member_name) as source, open(destination, "wb") as dest_fh:
+                        shutil.copyfileobj(source, dest_fh)
+            else:
+                with tarfile.open(tar_path, "r:gz") as tar:
+                    member = next(
+                        (m for m in tar.getmembers() if Path(m.name).name == bin_name),
+                        None,
+                    )
+                    if not member:
+                        raise RuntimeError("Ripgrep binary not found in archive")
+                    extracted = tar.extractfile(member)
+                    if not extracted:
+                        raise RuntimeError("Failed to extract ripgrep binary")
+                    with open(destination, "wb") as dest_fh:
+                        shutil.copyfileobj(extracted, dest_fh)
+        except (zipfile.BadZipFile, tarfile.TarError, OSError) as exc:
+            raise RuntimeError("Failed to extract ripgrep archive") from exc
 
     destination.chmod(destination.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
     logger.info("Installed ripgrep to {destination}", destination=destination)
@@ -42,6 +42,10 @@ class MCPTool[T: ClientTransport](CallableTool):
             )
             return convert_tool_result(result)
 
+    async def close(self) -> None:
+        """Close the connection of the MCP client, which may be shared with other tools."""
+        await self._client.close()
+
 
 def convert_tool_result(result: CallToolResult) -> ToolReturnType:
     content: list[ContentPart] = []
@@ -139,37 +139,41 @@ class Task(CallableTool2[Params]):
                 _super_wire_send(msg)
 
         subagent_history_file = await self._get_subagent_history_file()
-        context = Context(file_backend=subagent_history_file)
+        context = Context(
+            file_backend=subagent_history_file, storage=self._runtime.config.context_storage
+        )
         soul = KimiSoul(agent, runtime=self._runtime, context=context)
-
         try:
-            await run_soul(soul, prompt, _ui_loop_fn, asyncio.Event())
-        except MaxStepsReached as e:
-            return ToolError(
-                message=(
-                    f"Max steps {e.n_steps} reached when running subagent. "
-                    "Please try splitting the task into smaller subtasks."
-                ),
-                brief="Max steps reached",
-            )
-
-        _error_msg = (
-            "The subagent seemed not to run properly. Maybe you have to do the task yourself."
-        )
-
-        # Check if the subagent context is valid
-        if len(context.history) == 0 or context.history[-1].role != "assistant":
-            return ToolError(message=_error_msg, brief="Failed to run subagent")
-
-        final_response = message_extract_text(context.history[-1])
+            try:
+                await run_soul(soul, prompt, _ui_loop_fn, asyncio.Event())
+            except MaxStepsReached as e:
+                return ToolError(
+                    message=(
+                        f"Max steps {e.n_steps} reached when running subagent. "
+                        "Please try splitting the task into smaller subtasks."
+                    ),
+                    brief="Max steps reached",
+                )
 
-        # Check if response is too brief, if so, run again with continuation prompt
-        n_attempts_remaining = MAX_CONTINUE_ATTEMPTS
-        if len(final_response) < 200 and n_attempts_remaining > 0:
-            await run_soul(soul, CONTINUE_PROMPT, _ui_loop_fn, asyncio.Event())
+            _error_msg = (
+                "The subagent seemed not to run properly. Maybe you have to do the task yourself."
+            )
 
+            # Check if the subagent context is valid
             if len(context.history) == 0 or context.history[-1].role != "assistant":
                 return ToolError(message=_error_msg, brief="Failed to run subagent")
+
             final_response = message_extract_text(context.history[-1])
 
-        return ToolOk(output=final_response)
+            # Check if response is too brief, if so, run again with continuation prompt
+            n_attempts_remaining = MAX_CONTINUE_ATTEMPTS
+            if len(final_response) < 200 and n_attempts_remaining > 0:
+                await run_soul(soul, CONTINUE_PROMPT, _ui_loop_fn, asyncio.Event())
+
+                if len(context.history) == 0 or context.history[-1].role != "assistant":
+                    return ToolError(message=_error_msg, brief="Failed to run subagent")
+                final_response = message_extract_text(context.history[-1])
+
+            return ToolOk(output=final_response)
+        finally:
+            await context.close()
@@ -7,7 +7,7 @@ from kosong.tooling import CallableTool2, ToolReturnType
 from pydantic import BaseModel, Field
 
 from kimi_cli.tools.utils import ToolResultBuilder, load_desc
-from kimi_cli.utils.aiohttp import new_client_session
+from kimi_cli.utils.aiohttp import get_client_session
 
 
 class Params(BaseModel):
@@ -24,18 +24,15 @@ class FetchURL(CallableTool2[Params]):
         builder = ToolResultBuilder(max_line_length=None)
 
         try:
-            async with (
-                new_client_session() as session,
-                session.get(
-                    params.url,
-                    headers={
-                        "User-Agent": (
-                            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                            "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-                        ),
-                    },
-                ) as response,
-            ):
+            async with get_client_session().get(
+                params.url,
+                headers={
+                    "User-Agent": (
+                        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                        "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+                    ),
+                },
+            ) as response:
                 if response.status >= 400:
                     return builder.error(
                         (
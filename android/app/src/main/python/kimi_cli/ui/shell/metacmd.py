@@ -212,7 +212,11 @@ async def init(app: ShellApp, args: list[str]):
         console.print("Analyzing the codebase...")
         tmp_context = Context(file_backend=Path(temp_dir) / "context.jsonl")
         app.soul = KimiSoul(soul_bak._agent, soul_bak._runtime, context=tmp_context)
-        ok = await app._run_soul_command(prompts.INIT, thinking=False)
+        try:
+            ok = await app._run_soul_command(prompts.INIT, thinking=False)
+        finally:
+            # release the history files before the temporary directory is removed
+            await tmp_context.close()
 
         if ok:
             console.print(
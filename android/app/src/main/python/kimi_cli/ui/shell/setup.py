@@ -11,7 +11,7 @@ from pydantic import SecretStr
 from kimi_cli.config import LLMModel, LLMProvider, MoonshotSearchConfig, load_config, save_config
 from kimi_cli.ui.shell.console import console
 from kimi_cli.ui.shell.metacmd import meta_command
-from kimi_cli.utils.aiohttp import new_client_session
+from kimi_cli.utils.aiohttp import get_client_session
 
 if TYPE_CHECKING:
     from kimi_cli.ui.shell import ShellApp
@@ -111,16 +111,13 @@ async def _setup() -> _SetupResult | None:
     # list models
     models_url = f"{platform.base_url}/models"
     try:
-        async with (
-            new_client_session() as session,
-            session.get(
-                models_url,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                },
-                raise_for_status=True,
-            ) as response,
-        ):
+        async with get_client_session().get(
+            models_url,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+            },
+            raise_for_status=True,
+        ) as response:
             resp_json = await response.json()
     except aiohttp.ClientError as e:
         console.print(f"[red]Failed to get models: {e}[/red]")
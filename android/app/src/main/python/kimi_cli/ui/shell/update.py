@@ -15,7 +15,7 @@ import aiohttp
 
 from kimi_cli.share import get_share_dir
 from kimi_cli.ui.shell.console import console
-from kimi_cli.utils.aiohttp import new_client_session
+from kimi_cli.utils.aiohttp import get_client_session
 from kimi_cli.utils.logging import logger
 
 BASE_URL = "https://cdn.kimi.com/binaries/kimi-cli"
@@ -98,102 +98,102 @@ async def _do_update(*, print: bool, check_only: bool) -> UpdateResult:
         _print("[red]Failed to detect target platform.[/red]")
         return UpdateResult.UNSUPPORTED
 
-    async with new_client_session() as session:
-        logger.info("Checking for updates...")
-        _print("Checking for updates...")
-        latest_version = await _get_latest_version(session)
-        if not latest_version:
-            _print("[red]Failed to check for updates.[/red]")
-            return UpdateResult.FAILED
-
-        logger.debug("Latest version: {latest_version}", latest_version=latest_version)
-        LATEST_VERSION_FILE.write_text(latest_version, encoding="utf-8")
+    session = get_client_session()
+    logger.info("Checking for updates...")
+    _print("Checking for updates...")
+    latest_version = await _get_latest_version(session)
+    if not latest_version:
+        _print("[red]Failed to check for updates.[/red]")
+        return UpdateResult.FAILED
 
-        cur_t = semver_tuple(current_version)
-        lat_t = semver_tuple(latest_version)
+    logger.debug("Latest version: {latest_version}", latest_version=latest_version)
+    LATEST_VERSION_FILE.write_text(latest_version, encoding="utf-8")
 
-        if cur_t >= lat_t:
-            logger.debug("Already up to date: {current_version}", current_version=current_version)
-            _print("[green]Already up to date.[/green]")
-            return UpdateResult.UP_TO_DATE
+    cur_t = semver_tuple(current_version)
+    lat_t = semver_tuple(latest_version)
 
-        if check_only:
-            logger.info(
-                "Update available: current={current_version}, latest={latest_version}",
-                current_version=current_version,
-                latest_version=latest_version,
-            )
-            _print(f"[yellow]Update available: {latest_version}[/yellow]")
-            return UpdateResult.UPDATE_AVAILABLE
+    if cur_t >= lat_t:
+        logger.debug("Already up to date: {current_version}", current_version=current_version)
+        _print("[green]Already up to date.[/green]")
+        return UpdateResult.UP_TO_DATE
 
+    if check_only:
         logger.info(
-            "Updating from {current_version} to {latest_version}...",
+            "Update available: current={current_version}, latest={latest_version}",
             current_version=current_version,
             latest_version=latest_version,
         )
-        _print(f"Updating from {current_version} to {latest_version}...")
-
-        filename = f"kimi-{latest_version}-{target}.tar.gz"
-        download_url = f"{BASE_URL}/{latest_version}/{filename}"
-
-        with tempfile.TemporaryDirectory(prefix="kimi-cli-") as tmpdir:
-            tar_path = os.path.join(tmpdir, filename)
-
-            logger.info("Downloading from {download_url}...", download_url=download_url)
-            _print("[grey50]Downloading...[/grey50]")
-            try:
-                async with session.get(download_url) as resp:
-                    resp.raise_for_status()
-                    with open(tar_path, "wb") as f:
-                        async for chunk in resp.content.iter_chunked(1024 * 64):
-                            if chunk:
-                                f.write(chunk)
-            except aiohttp.ClientError:
-                logger.exception(
-                    "Failed to download update from {download_url}",
-                    download_url=download_url,
-                )
-                _print("[red]Failed to download.[/red]")
-                return UpdateResult.FAILED
-            except Exception:
-                logger.exception("Failed to download:")
-                _print("[red]Failed to download.[/red]")
-                return UpdateResult.FAILED
+        _print(f"[yellow]Update available: {latest_version}[/yellow]")
+        return UpdateResult.UPDATE_AVAILABLE
+
+    logger.info(
+        "Updating from {current_version} to {latest_version}...",
+        current_version=current_version,
+        latest_version=latest_version,
+    )
+    _print(f"Updating from {current_version} to {latest_version}...")
+
+    filename = f"kimi-{latest_version}-{target}.tar.gz"
+    download_url = f"{BASE_URL}/{latest_version}/{filename}"
+
+    with tempfile.TemporaryDirectory(prefix="kimi-cli-") as tmpdir:
+        tar_path = os.path.join(tmpdir, filename)
+
+        logger.info("Downloading from {download_url}...", download_url=download_url)
+        _print("[grey50]Downloading...[/grey50]")
+        try:
+            async with session.get(download_url) as resp:
+                resp.raise_for_status()
+                with open(tar_path, "wb") as f:
+                    async for chunk in resp.content.iter_chunked(1024 * 64):
+                        if chunk:
+                            f.write(chunk)
+        except aiohttp.ClientError:
+            logger.exception(
+                "Failed to download update from {download_url}",
+                download_url=download_url,
+            )
+            _print("[red]Failed to download.[/red]")
+            return UpdateResult.FAILED
+        except Exception:
+            logger.exception("Failed to download:")
+            _print("[red]Failed to download.[/red]")
+            return UpdateResult.FAILED
 
-            logger.info("Extracting archive {tar_path}...", tar_path=tar_path)
-            _print("[grey50]Extracting...[/grey50]")
-            try:
-                with tarfile.open(tar_path, "r:gz") as tar:
-                    tar.extractall(tmpdir)
-                binary_path = None
-                for root, _, files in os.walk(tmpdir):
-                    if "kimi" in files:
-                        binary_path = os.path.join(root, "kimi")
-                        break
-                if not binary_path:
-                    logger.error("Binary 'kimi' not found in archive.")
-                    _print("[red]Binary 'kimi' not found in archive.[/red]")
-                    return UpdateResult.FAILED
-            except Exception:
-                logger.exception("Failed to extract archive:")
-                _print("[red]Failed to extract archive.[/red]")
+        logger.info("Extracting archive {tar_path}...", tar_path=tar_path)
+        _print("[grey50]Extracting...[/grey50]")
+        try:
+            with tarfile.open(tar_path, "r:gz") as tar:
+                tar.extractall(tmpdir)
+            binary_path = None
+            for root, _, files in os.walk(tmpdir):
+                if "kimi" in files:
+                    binary_path = os.path.join(root, "kimi")
+                    break
+            if not binary_path:
+                logger.error("Binary 'kimi' not found in archive.")
+                _print("[red]Binary 'kimi' not found in archive.[/red]")
                 return UpdateResult.FAILED
+        except Exception:
+            logger.exception("Failed to extract archive:")
+            _print("[red]Failed to extract archive.[/red]")
+            return UpdateResult.FAILED
 
-            INSTALL_DIR.mkdir(parents=True, exist_ok=True)
-            dest_path = INSTALL_DIR / "kimi"
-            logger.info("Installing to {dest_path}...", dest_path=dest_path)
-            _print("[grey50]Installing...[/grey50]")
-
-            try:
-                shutil.copy2(binary_path, dest_path)
-                os.chmod(
-                    dest_path,
-                    os.stat(dest_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH,
-                )
-            except Exception:
-                logger.exception("Failed to install:")
-                _print("[red]Failed to install.[/red]")
-                return UpdateResult.FAILED
+        INSTALL_DIR.mkdir(parents=True, exist_ok=True)
+        dest_path = INSTALL_DIR / "kimi"
+        logger.info("Installing to {dest_path}...", dest_path=dest_path)
+        _print("[grey50]Installing...[/grey50]")
+
+        try:
+            shutil.copy2(binary_path, dest_path)
+            os.chmod(
+                dest_path,
+                os.stat(dest_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH,
+            )
+        except Exception:
+            logger.exception("Failed to install:")
+            _print("[red]Failed to install.[/red]")
+            return UpdateResult.FAILED
 
     _print("[green]Updated successfully![/green]")
     _print("[yellow]Restart Kimi CLI to use the new version.[/yellow]")
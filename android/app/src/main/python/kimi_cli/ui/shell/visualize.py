@@ -20,6 +20,7 @@ from kimi_cli.soul import StatusSnapshot
 from kimi_cli.tools import extract_key_argument
 from kimi_cli.ui.shell.console import console
 from kimi_cli.ui.shell.keyboard import KeyEvent, listen_for_keyboard
+from kimi_cli.utils.logging import logger
 from kimi_cli.utils.rich.columns import BulletColumns
 from kimi_cli.utils.rich.markdown import Markdown
 from kimi_cli.wire import WireMessage, WireUISide
@@ -31,6 +32,7 @@ from kimi_cli.wire.message import (
     StatusUpdate,
     StepBegin,
     StepInterrupted,
+    StepMetrics,
     SubagentEvent,
 )
 
@@ -264,13 +266,32 @@ class _ApprovalRequestPanel:
 class _StatusBlock:
     def __init__(self, initial: StatusSnapshot) -> None:
         self.text = Text("", justify="right", style="grey50")
-        self.update(initial)
+        self._status = initial
+        self._metrics: StepMetrics | None = None
+        self._refresh()
 
     def render(self) -> RenderableType:
         return self.text
 
     def update(self, status: StatusSnapshot) -> None:
-        self.text.plain = f"context: {status.context_usage:.1%}"
+        self._status = status
+        self._refresh()
+
+    def update_metrics(self, metrics: StepMetrics) -> None:
+        self._metrics = metrics
+        self._refresh()
+
+    def _refresh(self) -> None:
+        self.text.plain = f"context: {self._status.context_usage:.1%}"
+        if self._status.cache_hit_rate:
+            self.text.plain += f", cache: {self._status.cache_hit_rate:.0%}"
+        if self._metrics is not None:
+            self.text.plain += f", step: {self._metrics.duration_s:.1f}s"
+            first_token = next(
+                (span for span in self._metrics.spans if span.name == "first_token"), None
+            )
+            if first_token is not None:
+                self.text.plain += f" (first token: {first_token.duration_s:.1f}s)"
 
 
 @asynccontextmanager
@@ -382,6 +403,15 @@ class _LiveView:
                 self.refresh_soon()
             case StatusUpdate(status=status):
                 self._status_block.update(status)
+            case StepMetrics():
+                logger.debug(
+                    "Step {n} took {duration_s:.3f}s: {spans}",
+                    n=msg.n,
+                    duration_s=msg.duration_s,
+                    spans=", ".join(f"{span.name} {span.duration_s:.3f}s" for span in msg.spans),
+                )
+                self._status_block.update_metrics(msg)
+                self.refresh_soon()
             case ContentPart():
                 self.append_content(msg)
             case ToolCall():
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import asyncio
 import ssl
+import weakref
+from dataclasses import dataclass
 
 import aiohttp
 import certifi
@@ -8,5 +11,71 @@ import certifi
 _ssl_context = ssl.create_default_context(cafile=certifi.where())
 
 
-def new_client_session() -> aiohttp.ClientSession:
-    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=_ssl_context))
+@dataclass(frozen=True, slots=True, kw_only=True)
+class ClientSessionOptions:
+    """Options of the shared client session."""
+
+    limit: int = 100
+    """Maximum number of simultaneous connections."""
+    limit_per_host: int = 8
+    """Maximum number of simultaneous connections to the same host."""
+    keepalive_timeout: float = 60
+    """Seconds to keep an idle connection alive for reuse."""
+    dns_cache_ttl: int = 300
+    """Seconds to cache resolved DNS entries."""
+    total_timeout: float | None = 300
+    """Total timeout of a request in seconds, None for no limit."""
+    connect_timeout: float | None = 30
+    """Timeout for acquiring a connection and connecting, None for no limit."""
+    sock_read_timeout: float | None = 120
+    """Timeout between two reads from the socket, None for no limit."""
+
+
+_options = ClientSessionOptions()
+_shared_sessions = weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]()
+
+
+def new_client_session(options: ClientSessionOptions | None = None) -> aiohttp.ClientSession:
+    """Create a new client session. The caller owns it and must close it."""
+    options = options or _options
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            ssl=_ssl_context,
+            limit=options.limit,
+            limit_per_host=options.limit_per_host,
+            keepalive_timeout=options.keepalive_timeout,
+            ttl_dns_cache=options.dns_cache_ttl,
+        ),
+        timeout=aiohttp.ClientTimeout(
+            total=options.total_timeout,
+            connect=options.connect_timeout,
+            sock_read=options.sock_read_timeout,
+        ),
+    )
+
+
+def set_client_session_options(options: ClientSessionOptions) -> None:
+    """Set the options used by shared client sessions created after this call."""
+    global _options
+    _options = options
+
+
+def get_client_session() -> aiohttp.ClientSession:
+    """
+    Get the client session shared by all callers on the running event loop, creating it
+    on first use. Connections are kept alive and reused across calls, so callers must not
+    close it; use `close_client_session` on shutdown instead.
+    """
+    loop = asyncio.get_running_loop()
+    session = _shared_sessions.get(loop)
+    if session is None or session.closed:
+        session = new_client_session()
+        _shared_sessions[loop] = session
+    return session
+
+
+async def close_client_session() -> None:
+    """Close the shared client session of the running event loop, if any."""
+    session = _shared_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
@@ -10,6 +10,9 @@ import aiofiles.os
 _ROTATION_OPEN_FLAGS = os.O_CREAT | os.O_EXCL | os.O_WRONLY
 _ROTATION_FILE_MODE = 0o600
 
+ROTATION_COUNTER_SUFFIX = ".rotation"
+"""Suffix of the files persisting the last rotation number of a path."""
+
 
 async def _reserve_rotation_path(path: Path) -> bool:
     """Atomically create an empty file as a reservation for *path*."""
@@ -25,12 +28,38 @@ async def _reserve_rotation_path(path: Path) -> bool:
     return True
 
 
+async def _read_rotation_counter(counter_file: Path) -> int | None:
+    try:
+        async with aiofiles.open(counter_file, encoding="utf-8") as f:
+            return int(await f.read())
+    except (OSError, ValueError):
+        return None
+
+
+async def _write_rotation_counter(counter_file: Path, num: int) -> None:
+    async with aiofiles.open(counter_file, "w", encoding="utf-8") as f:
+        await f.write(str(num))
+
+
+async def _scan_rotations(path: Path) -> int:
+    """Find the largest existing rotation number of *path* by listing its directory."""
+    pattern = re.compile(rf"^{re.escape(path.stem)}_(\d+){re.escape(path.suffix)}$")
+    max_num = 0
+    for entry in await aiofiles.os.listdir(path.parent):
+        if match := pattern.match(entry):
+            max_num = max(max_num, int(match.group(1)))
+    return max_num
+
+
 async def next_available_rotation(path: Path) -> Path | None:
     """Return a reserved rotation path for *path* or ``None`` if parent is missing.
 
     The caller must overwrite/reuse the returned path immediately because this helper
     commits an empty placeholder file to guarantee uniqueness. It is therefore suited
     for rotating *files* (like history logs) but **not** directory creation.
+
+    The last used number is persisted in a ``<stem>.rotation`` file next to *path*, so the
+    directory is only listed when that counter is missing.
     """
 
     if not path.parent.exists():
@@ -38,15 +67,15 @@ async def next_available_rotation(path: Path) -> Path | None:
 
     base_name = path.stem
     suffix = path.suffix
-    pattern = re.compile(rf"^{re.escape(base_name)}_(\d+){re.escape(suffix)}$")
-    max_num = 0
-    for entry in await aiofiles.os.listdir(path.parent):
-        if match := pattern.match(entry):
-            max_num = max(max_num, int(match.group(1)))
+    counter_file = path.parent / f"{base_name}{ROTATION_COUNTER_SUFFIX}"
+    last_num = await _read_rotation_counter(counter_file)
+    if last_num is None:
+        last_num = await _scan_rotations(path)
 
-    next_num = max_num + 1
+    next_num = last_num + 1
     while True:
         next_path = path.parent / f"{base_name}_{next_num}{suffix}"
         if await _reserve_rotation_path(next_path):
+            await _write_rotation_counter(counter_file, next_num)
             return next_path
         next_num += 1
@@ -54,6 +54,27 @@ class StatusUpdate(BaseModel):
     """The snapshot of the current soul status."""
 
 
+class MetricSpan(BaseModel):
+    name: str
+    """What the span measures, e.g. `llm_request`, `first_token` or `tool_call`."""
+    start_s: float
+    """The start of the span, relative to the beginning of the step (unit: s)."""
+    duration_s: float
+    attributes: dict[str, str | int | float | bool] = Field(default_factory=dict)
+
+
+class StepMetrics(BaseModel):
+    """
+    Latency metrics of an agent step.
+    This event is sent at the end of a step, before the next `StepBegin`.
+    """
+
+    n: int
+    """The step number."""
+    duration_s: float
+    spans: list[MetricSpan]
+
+
 class SubagentEvent(BaseModel):
     task_tool_call_id: str
     """The ID of the task tool call associated with this subagent."""
@@ -61,7 +82,9 @@ class SubagentEvent(BaseModel):
     """The event from the subagent."""
 
 
-type ControlFlowEvent = StepBegin | StepInterrupted | CompactionBegin | CompactionEnd | StatusUpdate
+type ControlFlowEvent = (
+    StepBegin | StepInterrupted | CompactionBegin | CompactionEnd | StatusUpdate | StepMetrics
+)
 """Any control flow event."""
 type Event = ControlFlowEvent | ContentPart | ToolCall | ToolCallPart | ToolResult | SubagentEvent
 """Any event, including control flow and content/tooling events."""
@@ -122,8 +145,13 @@ def serialize_event(event: Event) -> dict[str, Any]:
         case StatusUpdate():
             return {
                 "type": "status_update",
-                "payload": {"context_usage": event.status.context_usage},
+                "payload": {
+                    "context_usage": event.status.context_usage,
+                    "cache_hit_rate": event.status.cache_hit_rate,
+                },
             }
+        case StepMetrics():
+            return {"type": "step_metrics", "payload": event.model_dump(mode="json")}
         case ContentPart():
             return {
                 "type": "content_part",
@@ -0,0 +1,111 @@
+"""Test which messages the context compactions preserve and how they summarize the rest"""
+
+import asyncio
+from types import SimpleNamespace
+
+from kosong.message import Message, TextPart, ToolCall
+
+import kimi_cli.prompts as prompts
+import kimi_cli.soul.compaction as compaction
+from kimi_cli.llm import LLM
+from kimi_cli.soul.compaction import ChunkedCompaction, SimpleCompaction
+from kimi_cli.soul.tokens import HeuristicTokenEstimator
+
+
+def _llm(max_context_size: int = 128_000) -> LLM:
+    return LLM(
+        chat_provider=SimpleNamespace(model_name="test"),  # type: ignore[arg-type]
+        max_context_size=max_context_size,
+        capabilities=set(),
+    )
+
+
+def _tool_call_round(i: int, output: str) -> list[Message]:
+    tool_call = ToolCall(
+        id=f"call_{i}",
+        function=ToolCall.FunctionBody(name="ReadFile", arguments='{"path": "a.py"}'),
+    )
+    return [
+        Message(role="assistant", content=f"Reading {i}", tool_calls=[tool_call]),
+        Message(role="tool", content=[TextPart(text=output)], tool_call_id=tool_call.id),
+    ]
+
+
+def _text(message: Message) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(part.text for part in message.content if isinstance(part, TextPart))
+
+
+def _fake_summarize(monkeypatch):
+    async def _summarize(prompt, llm, max_completion_tokens):
+        return [TextPart(text="summary")]
+
+    monkeypatch.setattr(compaction, "_summarize", _summarize)
+
+
+def test_preserves_recent_messages_within_budget():
+    history = [Message(role="user", content=f"question {i}") for i in range(10)]
+    index = compaction._preserve_start_index(history, _llm(), HeuristicTokenEstimator())
+    assert index == 0
+
+
+def test_preserves_over_budget_tool_output(monkeypatch):
+    _fake_summarize(monkeypatch)
+    history = [
+        Message(role="user", content="old question"),
+        Message(role="assistant", content="old answer"),
+        Message(role="user", content="read the file"),
+        *_tool_call_round(0, "x" * 200_000),
+    ]
+    llm = _llm()
+    index = compaction._preserve_start_index(history, llm, HeuristicTokenEstimator())
+    assert index == 3
+
+    compacted = asyncio.run(SimpleCompaction().compact(history, llm))
+    assert [message.role for message in compacted] == ["assistant", "assistant", "tool"]
+    assert compacted[1].tool_calls == history[3].tool_calls
+    assert compacted[2].tool_call_id == "call_0"
+    assert "chars truncated" in _text(compacted[2])
+    n_tokens = sum(HeuristicTokenEstimator().estimate(message) for message in compacted[1:])
+    assert n_tokens <= llm.preserved_context_ratio * llm.max_context_size
+
+
+def test_preserves_over_budget_user_message(monkeypatch):
+    _fake_summarize(monkeypatch)
+    prompt = "y" * 100_000
+    history = [
+        Message(role="user", content="old question"),
+        Message(role="assistant", content="old answer"),
+        Message(role="user", content=[TextPart(text="<system>CHECKPOINT 1</system>")]),
+        Message(role="user", content=prompt),
+    ]
+    compacted = asyncio.run(SimpleCompaction().compact(history, _llm()))
+    assert [message.role for message in compacted] == ["assistant", "user"]
+    assert compacted[1].content == prompt
+
+
+def test_chunked_compaction_sends_one_chunk_at_a_time(monkeypatch):
+    prompt_tokens: list[int] = []
+
+    async def _summarize(prompt, llm, max_completion_tokens):
+        prompt_tokens.append(HeuristicTokenEstimator.estimate_text(prompt))
+        # summaries too long to merge even two of them in one chunk
+        return [TextPart(text="s" * 12_000)]
+
+    monkeypatch.setattr(compaction, "_summarize", _summarize)
+    history = []
+    for i in range(20):
+        history.append(Message(role="user", content=f"question {i} " + "q" * 4_000))
+        history.append(Message(role="assistant", content=f"answer {i}"))
+    llm = _llm(max_context_size=8_000)
+
+    compacted = asyncio.run(ChunkedCompaction().compact(history, llm))
+    assert compacted[0].role == "assistant"
+    assert _text(compacted[0]).endswith("s" * 100)
+    max_chunk_tokens = int(llm.max_context_size * ChunkedCompaction.MAX_CHUNK_USAGE)
+    template_tokens = max(
+        HeuristicTokenEstimator.estimate_text(template)
+        for template in (prompts.COMPACT, prompts.COMPACT_SEGMENT)
+    )
+    assert max(prompt_tokens) <= max_chunk_tokens + template_tokens
@@ -0,0 +1,27 @@
+"""Test that restore snapshots of a growing history are written in linear total size"""
+
+import asyncio
+from pathlib import Path
+
+from kosong.message import Message
+
+from kimi_cli.config import ContextStorage
+from kimi_cli.soul.context import Context
+
+
+def test_snapshot_writes_stay_linear(tmp_path: Path):
+    async def _run() -> tuple[int, int]:
+        storage = ContextStorage(snapshot_interval_bytes=1 << 10)
+        context = Context(tmp_path / "history.jsonl", storage=storage)
+        n_written = 0
+        for i in range(2_000):
+            await context.append_message(Message(role="user", content=f"message {i} " + "x" * 200))
+            offset = context._snapshot_offset
+            await context.flush()
+            if context._snapshot_offset != offset:
+                n_written += context._snapshot_bytes
+        await context.close()
+        return n_written, (tmp_path / "history.jsonl").stat().st_size
+
+    n_written, n_history = asyncio.run(_run())
+    assert 0 < n_written <= 6 * n_history
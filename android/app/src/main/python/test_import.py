@@ -1,16 +1,125 @@
-"""Test if kimi-cli can be imported correctly"""
-
-try:
-    from kimi_cli.app import KimiCLI
-    from kimi_cli.session import Session
-    from kimi_cli.soul.kimisoul import KimiSoul
-    from kimi_cli.utils.message import message_extract_text
-    print("SUCCESS: All kimi-cli imports successful!")
-    print(f"KimiCLI: {KimiCLI}")
-    print(f"Session: {Session}")
-    print(f"KimiSoul: {KimiSoul}")
-    print(f"message_extract_text: {message_extract_text}")
-except Exception as e:
-    print(f"ERROR: Failed to import kimi-cli: {e}")
-    import traceback
-    traceback.print_exc()
+"""Test if kimi-cli can be imported correctly, and that the bridge's cold import stays slim"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+BUDGET_FILE = Path(__file__).with_name("import_budget.json")
+# Allowed slack over the recorded baseline before the module count check fails
+MODULES_TOLERANCE = 1.1
+# Allowed slack over the recorded baseline before the import time check fails
+TIME_TOLERANCE = 1.5
+# Import time depends on the machine, so it is only checked when this is set
+CHECK_TIME_ENV = "KIMI_CHECK_IMPORT_TIME"
+# Modules that must never be loaded on the bridge's startup path
+FORBIDDEN_MODULES = ("typer", "click", "rich", "prompt_toolkit", "kimi_cli.cli", "kimi_cli.ui")
+
+_PROBE = """
+import json, sys, time
+before = set(sys.modules)
+start = time.perf_counter()
+import kimi_bridge
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({"ms": elapsed_ms, "modules": sorted(set(sys.modules) - before)}))
+"""
+
+
+def measure_bridge_import(runs: int = 5) -> dict:
+    """Cold-import `kimi_bridge` in fresh interpreters and keep the fastest run."""
+    best = None
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result["ms"] < best["ms"]:
+            best = result
+    return best
+
+
+def measure_interpreter_startup(runs: int = 5) -> float:
+    """Start an empty interpreter and keep the fastest run, to compare import times against."""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if best is None or elapsed_ms < best:
+            best = elapsed_ms
+    return best
+
+
+def test_kimi_cli_imports():
+    from kimi_cli.app import KimiCLI
+    from kimi_cli.session import Session
+    from kimi_cli.soul.kimisoul import KimiSoul
+    from kimi_cli.utils.message import message_extract_text
+
+    print("SUCCESS: All kimi-cli imports successful!")
+    print(f"KimiCLI: {KimiCLI}")
+    print(f"Session: {Session}")
+    print(f"KimiSoul: {KimiSoul}")
+    print(f"message_extract_text: {message_extract_text}")
+
+
+def test_bridge_import_budget():
+    result = measure_bridge_import()
+    loaded = [
+        m for m in result["modules"]
+        if any(m == name or m.startswith(name + ".") for name in FORBIDDEN_MODULES)
+    ]
+    assert not loaded, f"Bridge startup path imports UI/CLI modules: {loaded}"
+
+    baseline = json.loads(BUDGET_FILE.read_text(encoding="utf-8"))
+    n_modules = len(result["modules"])
+    assert n_modules <= baseline["n_modules"] * MODULES_TOLERANCE, (
+        f"Bridge imports {n_modules} modules, baseline is {baseline['n_modules']}"
+    )
+    print(f"SUCCESS: Bridge cold import loads {n_modules} modules")
+
+
+@pytest.mark.skipif(not os.environ.get(CHECK_TIME_ENV), reason=f"{CHECK_TIME_ENV} is not set")
+def test_bridge_import_time():
+    result = measure_bridge_import()
+    startup_ms = measure_interpreter_startup()
+    baseline = json.loads(BUDGET_FILE.read_text(encoding="utf-8"))
+    ratio = result["ms"] / startup_ms
+    assert ratio <= baseline["startup_ratio"] * TIME_TOLERANCE, (
+        f"Bridge cold import took {result['ms']:.0f} ms, {ratio:.1f} times the interpreter "
+        f"startup, baseline is {baseline['startup_ratio']:.1f} times"
+    )
+    print(f"SUCCESS: Bridge cold import {result['ms']:.0f} ms, {ratio:.1f} times the startup")
+
+
+def record_baseline():
+    result = measure_bridge_import()
+    baseline = {
+        "n_modules": len(result["modules"]),
+        "startup_ratio": round(result["ms"] / measure_interpreter_startup(), 2),
+    }
+    BUDGET_FILE.write_text(json.dumps(baseline, indent=2) + "\n", encoding="utf-8")
+    print(f"Recorded baseline: {baseline}")
+
+
+if __name__ == "__main__":
+    if "--record" in sys.argv:
+        record_baseline()
+        sys.exit(0)
+    try:
+        test_kimi_cli_imports()
+        test_bridge_import_budget()
+        test_bridge_import_time()
+    except Exception as e:
+        print(f"ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
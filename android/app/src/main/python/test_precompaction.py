@@ -0,0 +1,68 @@
+"""Test that the context is compacted in the background before it gets too long"""
+
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from kosong.message import Message
+
+import kimi_cli.soul.kimisoul as kimisoul
+from kimi_cli.config import LoopControl
+from kimi_cli.soul.context import Context
+from kimi_cli.soul.kimisoul import RESERVED_TOKENS, KimiSoul
+from kimi_cli.soul.metrics import StepMetricsRecorder
+
+
+class _FakeCompaction:
+    def __init__(self):
+        self.n_calls = 0
+
+    async def compact(self, messages, llm):
+        self.n_calls += 1
+        return [Message(role="assistant", content="summary"), *messages[-1:]]
+
+
+def _soul(context: Context, max_context_size: int) -> KimiSoul:
+    soul = KimiSoul.__new__(KimiSoul)
+    soul._context = context
+    soul._loop_control = LoopControl()
+    soul._runtime = SimpleNamespace(  # type: ignore[assignment]
+        llm=SimpleNamespace(
+            max_context_size=max_context_size,
+            chat_provider=SimpleNamespace(model_name="test"),
+            rate_governor=None,
+        )
+    )
+    soul._compaction = _FakeCompaction()
+    soul._reserved_tokens = RESERVED_TOKENS
+    soul._precompaction = None
+    soul._checkpoint_with_user_message = False
+    return soul
+
+
+@pytest.mark.parametrize("max_context_size", [128_000, 256_000])
+def test_precompaction_starts_before_context_is_too_long(
+    monkeypatch, tmp_path: Path, max_context_size: int
+):
+    monkeypatch.setattr(kimisoul, "wire_send", lambda message: None)
+
+    async def _run() -> dict:
+        soul = _soul(Context(tmp_path / "history.jsonl"), max_context_size)
+        hard_threshold = max_context_size - RESERVED_TOKENS
+        for step, token_count in enumerate(range(5_000, hard_threshold + 5_000, 5_000)):
+            await soul._checkpoint()
+            await soul._context.append_message(
+                [Message(role="user", content=f"u{step}"), Message(role="assistant", content="a")]
+            )
+            await soul._context.update_token_count(token_count)
+            metrics = StepMetricsRecorder(step)
+            await soul._compact_if_needed(metrics)
+            if spans := metrics.finish().spans:
+                return spans[0].attributes
+            # let the background compaction run
+            await asyncio.sleep(0)
+        return {}
+
+    attributes = asyncio.run(_run())
+    assert attributes == {"background": True, "blocking": False}
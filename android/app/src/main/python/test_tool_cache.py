@@ -0,0 +1,61 @@
+"""Test that cached tool results are only used while the files they depend on are unchanged"""
+
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from kosong.message import ToolCall
+from kosong.tooling import ToolOk
+
+from kimi_cli.soul.tool_cache import ToolResultCache
+
+
+def _cache(work_dir: Path) -> ToolResultCache:
+    return ToolResultCache(work_dir, max_bytes=1 << 20, max_entry_bytes=1 << 16)
+
+
+def _tool_call(name: str, **arguments: str) -> ToolCall:
+    return ToolCall(
+        id="call_0",
+        function=ToolCall.FunctionBody(name=name, arguments=json.dumps(arguments)),
+    )
+
+
+def _put(cache: ToolResultCache, tool_call: ToolCall, output: str) -> str:
+    key = cache.key(tool_call)
+    assert key is not None
+    fingerprint = cache.fingerprint(tool_call)
+    assert fingerprint is not None
+    cache.put(key, fingerprint, ToolOk(output=output))
+    return key
+
+
+def test_grep_is_invalidated_by_in_place_edit(tmp_path: Path):
+    file = tmp_path / "src" / "a.py"
+    file.parent.mkdir()
+    file.write_text("needle = 1\n")
+    cache = _cache(tmp_path)
+    key = _put(cache, _tool_call("Grep", pattern="needle"), "src/a.py")
+    assert asyncio.run(cache.get(key)) is not None
+
+    mtime_ns = file.stat().st_mtime_ns
+    file.write_text("haystack = 1\n")
+    # the directory mtime is unchanged by an in-place edit
+    os.utime(file, ns=(mtime_ns + 1_000_000, mtime_ns + 1_000_000))
+    assert asyncio.run(cache.get(key)) is None
+
+
+def test_get_tolerates_clear_while_checking_files(tmp_path: Path):
+    (tmp_path / "a.py").write_text("a = 1\n")
+    cache = _cache(tmp_path)
+    key = _put(cache, _tool_call("ReadFile", path="a.py"), "a = 1")
+
+    async def _run() -> list[ToolOk | None]:
+        gets = [asyncio.create_task(cache.get(key)) for _ in range(2)]
+        await asyncio.sleep(0)
+        cache.clear()
+        return await asyncio.gather(*gets)
+
+    assert asyncio.run(_run()) == [None, None]
+    assert cache.stats.n_entries == 0
@@ -0,0 +1,30 @@
+"""Test which concurrent tool calls the toolset runs in parallel"""
+
+import json
+
+from kosong.message import ToolCall
+
+from kimi_cli.soul.toolset import _tool_effect
+
+
+def _tool_call(name: str, **arguments: str) -> ToolCall:
+    return ToolCall(
+        id="call_0",
+        function=ToolCall.FunctionBody(name=name, arguments=json.dumps(arguments)),
+    )
+
+
+def test_tasks_run_in_parallel():
+    task = _tool_effect(_tool_call("Task", prompt="fix a.py"))
+    assert not task.conflicts_with(_tool_effect(_tool_call("Task", prompt="fix b.py")))
+    assert task.conflicts_with(_tool_effect(_tool_call("Bash", command="ls")))
+    assert task.conflicts_with(_tool_effect(_tool_call("ReadFile", path="a.py")))
+
+
+def test_unknown_tools_conflict_with_everything():
+    bash = _tool_effect(_tool_call("Bash", command="ls"))
+    assert bash.conflicts_with(_tool_effect(_tool_call("Bash", command="pwd")))
+    assert bash.conflicts_with(_tool_effect(_tool_call("Grep", pattern="x")))
+    assert not _tool_effect(_tool_call("Grep", pattern="x")).conflicts_with(
+        _tool_effect(_tool_call("ReadFile", path="a.py"))
+    )